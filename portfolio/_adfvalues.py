@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+"""
+MacKinnon (1994) response surface coefficients for the p-values of the
+Dickey-Fuller test of a single series (N = 1), by trend regression.
+
+Values are copied from statsmodels.tsa.adfvalues (statsmodels 0.15,
+BSD-3-Clause license, Copyright (C) 2006 Jonathan E. Taylor and the
+statsmodels Developers), where they are private and may change between
+releases. Source: MacKinnon, J.G. (1994), "Approximate asymptotic
+distribution functions for unit-root and cointegration tests", Journal of
+Business & Economic Statistics, 12, 167-176.
+"""
+
+# Largest and smallest statistics with p-values below 1 and above 0
+TAU_MAX = {'n': float('inf'), 'c': 2.74, 'ct': 0.7, 'ctt': 0.54}
+TAU_MIN = {'n': -19.04, 'c': -18.83, 'ct': -16.18, 'ctt': -17.17}
+
+# Cut-off between the left tail and the rest of the distribution
+TAU_STAR = {'n': -1.04, 'c': -1.61, 'ct': -2.89, 'ctt': -3.21}
+
+# Polynomial coefficients in increasing powers, left tail and the rest
+TAU_SMALL_P = {
+    'n': [0.6344, 1.2378, 3.2496e-2],
+    'c': [2.1659, 1.4412, 3.8269e-2],
+    'ct': [3.2512, 1.6047, 4.9588e-2],
+    'ctt': [4.0003, 1.658, 4.8288e-2],
+}
+TAU_LARGE_P = {
+    'n': [0.4797, 9.3557e-1, -6.999e-2, 3.3066e-2],
+    'c': [1.7339, 9.3202e-1, -1.2745e-1, -1.0368e-2],
+    'ct': [2.5261, 6.1654e-1, -3.7956e-1, -6.0285e-2],
+    'ctt': [3.0778, 4.9529e-1, -4.1477e-1, -5.9359e-2],
+}
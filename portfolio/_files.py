@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+# Import standard libraries
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode='wb'):
+    """
+    Open a temporary file next to `path` and move it over `path` on exit.
+
+    Readers see either the previous or the complete new file, and a crash
+    while writing never leaves a partial one. Files already opened or
+    memory-mapped keep the previous contents. The temporary file is removed
+    if writing fails.
+    """
+    temp_path = path.with_name(path.name + '.tmp')
+    try:
+        with open(temp_path, mode) as file:
+            yield file
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+    os.replace(temp_path, path)
+
+
+def validate_format(path, formats, file_kind):
+    if path.suffix not in formats:
+        msg1 = f'{file_kind} file format {path.suffix} is not recognized.'
+        msg2 = f'Available formats: {", ".join(formats)}.'
+        raise ValueError(' '.join([msg1, msg2]))
+
+    return path
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+# Import third-party libraries
+import numpy as np
+
+
+def hurst_exponents(matrix, lags=20, min_tau=None):
+    """
+    Hurst exponents of every row of a series x time array.
+
+    Rows can be separate series or the windows of a strided view over one
+    series. For every lag in range(2, lags), the dispersion of the lagged
+    differences of all rows is computed at once, and the slope of log
+    dispersion on log lag comes from the closed-form least squares fit.
+    Zero dispersions are replaced by `min_tau` when given.
+    """
+    values = np.asarray(matrix, dtype=np.float64)
+    lag_vector = np.arange(2, lags)
+
+    # Square root of the standard deviation of the lagged differences
+    tau = np.stack([np.sqrt(np.std(values[..., lag:] - values[..., :-lag], axis=-1)) for lag in lag_vector], axis=-1)
+    if min_tau is not None:
+        tau = np.where(tau == 0, min_tau, tau)
+
+    # Least squares slope, shared lags so only log(tau) varies across rows
+    log_lags = np.log(lag_vector)
+    centered_lags = log_lags - log_lags.mean()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = (np.log(tau) @ centered_lags) / (centered_lags @ centered_lags)
+
+    return slopes * 2
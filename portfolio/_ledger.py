@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+
+# Import third-party libraries
+import pandas as pd
+import numpy as np
+
+
+class TradeLedger():
+    """
+    Sparse record of the positions taken by one backtest option.
+
+    Every event is a run of consecutive dates over which a symbol holds the
+    same position code (its risk bucket, 1 for low risk and 2 for high
+    risk), stored as integer date positions: entry is the first date of the
+    run and exit is the first date after it. The dense date x symbol
+    trading logs are only materialized by to_dense().
+    """
+
+    def __init__(self, entry_idx, exit_idx, symbol_idx, risk_bucket, dates, symbols):
+        self.entry_idx = np.asarray(entry_idx, dtype=np.int64)
+        self.exit_idx = np.asarray(exit_idx, dtype=np.int64)
+        self.symbol_idx = np.asarray(symbol_idx, dtype=np.int64)
+        self.risk_bucket = np.asarray(risk_bucket, dtype=np.int8)
+        self.dates = dates
+        self.symbols = symbols
+
+
+    @classmethod
+    def from_dense(cls, trading_logs):
+        return cls.from_array(trading_logs.to_numpy(dtype=np.int8), trading_logs.index, trading_logs.columns)
+
+
+    @classmethod
+    def from_array(cls, trading_logs, dates, symbols):
+        # Pad with empty dates so every run has a start and an end boundary
+        padded = np.zeros((trading_logs.shape[1], trading_logs.shape[0] + 2), dtype=np.int8)
+        padded[:, 1:-1] = trading_logs.T
+        symbol_idx, boundary_idx = np.nonzero(padded[:, 1:] != padded[:, :-1])
+
+        # A run lasts from one boundary to the next boundary of the same symbol
+        risk_bucket = padded[symbol_idx, boundary_idx + 1]
+        is_run = (risk_bucket != 0)[:-1] & (symbol_idx[1:] == symbol_idx[:-1])
+        is_run = np.append(is_run, False)
+
+        return cls(
+            boundary_idx[is_run],
+            boundary_idx[1:][is_run[:-1]],
+            symbol_idx[is_run],
+            risk_bucket[is_run],
+            dates,
+            symbols
+        )
+
+
+    def __len__(self):
+        return len(self.entry_idx)
+
+
+    def get_held_cells(self, symbol_order=None):
+        # Expand the runs of held positions to (date, symbol) cells
+        is_held = self.risk_bucket > 0
+        date_idx, symbol_idx, _ = self._expand(is_held)
+
+        # Order cells by date, then by symbol_order
+        symbol_rank = symbol_idx if symbol_order is None else np.asarray(symbol_order)[symbol_idx]
+        order = np.lexsort((symbol_rank, date_idx))
+
+        return date_idx[order], symbol_idx[order]
+
+
+    def get_trade_returns(self, daily_rets):
+        # Compound the daily returns over every run of held positions
+        is_held = self.risk_bucket > 0
+        date_idx, symbol_idx, _ = self._expand(is_held)
+        holding_days = self.exit_idx[is_held] - self.entry_idx[is_held]
+        if not len(date_idx):
+            return np.zeros(0), holding_days
+        
+        growth = np.nan_to_num(daily_rets[date_idx, symbol_idx]) + 1
+        trade_returns = np.multiply.reduceat(growth, np.cumsum(holding_days) - holding_days) - 1
+
+        return trade_returns, holding_days
+
+
+    def to_frame(self):
+        exit_dates = [self.dates[i] if i < len(self.dates) else pd.NaT for i in self.exit_idx]
+        frame = pd.DataFrame({
+            'entry_date': self.dates[self.entry_idx],
+            'exit_date': exit_dates,
+            'symbol': self.symbols[self.symbol_idx],
+            'risk_bucket': self.risk_bucket,
+        })
+
+        return frame.sort_values(by=['entry_date', 'symbol'], kind='mergesort').reset_index(drop=True)
+
+
+    def to_dense(self):
+        trading_logs = np.zeros((len(self.dates), len(self.symbols)), dtype=np.int8)
+        date_idx, symbol_idx, risk_bucket = self._expand(np.ones(len(self), dtype=bool))
+        trading_logs[date_idx, symbol_idx] = risk_bucket
+
+        return pd.DataFrame(data=trading_logs, columns=self.symbols, index=self.dates)
+
+
+    def _expand(self, event_mask):
+        entry_idx = self.entry_idx[event_mask]
+        lengths = self.exit_idx[event_mask] - entry_idx
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        date_idx = np.repeat(entry_idx, lengths) + offsets
+        symbol_idx = np.repeat(self.symbol_idx[event_mask], lengths)
+        risk_bucket = np.repeat(self.risk_bucket[event_mask], lengths)
+
+        return date_idx, symbol_idx, risk_bucket
+
+
+class LedgerRecorder():
+    """
+    Collects ledger events while a simulation steps through the dates.
+
+    Positions are passed as arrays of any shape (symbols, or options x
+    symbols); only the cells whose position code changed are touched.
+    """
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.entry_idx = np.zeros(int(np.prod(shape)), dtype=np.int64)
+        self.events = []
+
+
+    def update(self, date_idx, current_positions, new_positions):
+        current_positions = current_positions.reshape(-1)
+        new_positions = new_positions.reshape(-1)
+        changed = np.flatnonzero(current_positions != new_positions)
+        if not len(changed):
+            return self
+
+        # Close the runs that end today, open the ones that start today
+        old_buckets = current_positions[changed]
+        is_closed = old_buckets != 0
+        closed = changed[is_closed]
+        if len(closed):
+            self.events.append((self.entry_idx[closed], np.full(len(closed), date_idx), closed, old_buckets[is_closed]))
+
+        self.entry_idx[changed[new_positions[changed] != 0]] = date_idx
+
+        return self
+
+
+    def close(self, date_idx, current_positions):
+        return self.update(date_idx, current_positions, np.zeros_like(current_positions))
+
+
+    def copy(self):
+        recorder = LedgerRecorder(self.shape)
+        recorder.entry_idx = self.entry_idx.copy()
+        recorder.events = list(self.events)
+
+        return recorder
+
+
+    @classmethod
+    def concat(cls, recorders):
+        # Stack recorders of options x symbols shapes along the options
+        symbols_len = recorders[0].shape[-1]
+        recorder = cls((sum(item.shape[0] for item in recorders), symbols_len))
+        recorder.entry_idx = np.concatenate([item.entry_idx for item in recorders])
+
+        offset = 0
+        for item in recorders:
+            recorder.events.extend([(entry_idx, exit_idx, flat_idx + offset, risk_bucket) for entry_idx, exit_idx, flat_idx, risk_bucket in item.events])
+            offset += item.entry_idx.size
+
+        return recorder
+
+
+    def split(self):
+        # One recorder per option, events kept in their recorded order
+        options_count, symbols_len = self.shape
+        if self.events:
+            entry_idx, exit_idx, flat_idx, risk_bucket = [np.concatenate(items) for items in zip(*self.events)]
+        else:
+            entry_idx = exit_idx = flat_idx = np.zeros(0, dtype=np.int64)
+            risk_bucket = np.zeros(0, dtype=np.int8)
+        option_idx, symbol_idx = np.divmod(flat_idx, symbols_len)
+
+        recorders = []
+        for option_num in range(options_count):
+            recorder = LedgerRecorder((1, symbols_len))
+            recorder.entry_idx = self.entry_idx[option_num * symbols_len:(option_num + 1) * symbols_len].copy()
+            is_option = option_idx == option_num
+            if is_option.any():
+                recorder.events.append((entry_idx[is_option], exit_idx[is_option], symbol_idx[is_option], risk_bucket[is_option]))
+            recorders.append(recorder)
+
+        return recorders
+
+
+    def get_ledgers(self, dates, symbols):
+        # One ledger per leading index of the recorded shape
+        if self.events:
+            entry_idx, exit_idx, flat_idx, risk_bucket = [np.concatenate(items) for items in zip(*self.events)]
+        else:
+            entry_idx = exit_idx = flat_idx = np.zeros(0, dtype=np.int64)
+            risk_bucket = np.zeros(0, dtype=np.int8)
+
+        symbols_len = self.shape[-1]
+        option_idx, symbol_idx = np.divmod(flat_idx, symbols_len)
+        options_count = int(np.prod(self.shape[:-1]))
+
+        ledgers = []
+        for option_num in range(options_count):
+            is_option = option_idx == option_num
+            ledgers.append(TradeLedger(
+                entry_idx[is_option],
+                exit_idx[is_option],
+                symbol_idx[is_option],
+                risk_bucket[is_option],
+                dates,
+                symbols
+            ))
+
+        return ledgers
+
+
+class SimulationState():
+    """
+    Simulation state of a batch of options, to continue it on later dates.
+
+    Holds the positions, holding days and trailing P&L of every option x
+    symbol cell before `date_idx`, the first date not simulated yet, and
+    the LedgerRecorder of their runs. States of single options are stacked
+    into a batch with concat() and taken apart again with split().
+    """
+
+    def __init__(self, date_idx, positions, holding_days, trailing_pnl, ledger_recorder):
+        self.date_idx = date_idx
+        self.positions = positions
+        self.holding_days = holding_days
+        self.trailing_pnl = trailing_pnl
+        self.ledger_recorder = ledger_recorder
+
+
+    @classmethod
+    def start(cls, shape, date_idx):
+        return cls(
+            date_idx,
+            np.zeros(shape, dtype=np.int8),
+            np.zeros(shape, dtype=np.int64),
+            np.ones(shape, dtype=np.float64),
+            LedgerRecorder(shape)
+        )
+
+
+    @classmethod
+    def concat(cls, states):
+        if len({state.date_idx for state in states}) > 1:
+            raise ValueError('States must stop at the same date to be simulated together')
+
+        return cls(
+            states[0].date_idx,
+            np.concatenate([state.positions for state in states]),
+            np.concatenate([state.holding_days for state in states]),
+            np.concatenate([state.trailing_pnl for state in states]),
+            LedgerRecorder.concat([state.ledger_recorder for state in states])
+        )
+
+
+    def split(self):
+        # Rows are copied, so a kept option does not hold on to the whole batch
+        return [
+            SimulationState(
+                self.date_idx,
+                self.positions[option_num:option_num + 1].copy(),
+                self.holding_days[option_num:option_num + 1].copy(),
+                self.trailing_pnl[option_num:option_num + 1].copy(),
+                ledger_recorder
+            )
+            for option_num, ledger_recorder in enumerate(self.ledger_recorder.split())
+        ]
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+# Import standard libraries
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Object shared with the pool workers, read with get_shared()
+_shared = None
+
+
+def map_shared(func, shared, n_jobs, *iterables):
+    """
+    Map `func` over `iterables` with `n_jobs` worker processes, in order.
+
+    Tasks read `shared` (a panel, a price matrix, a Backtest...) with
+    get_shared() instead of receiving a pickled copy each. Forked workers
+    inherit it from the parent's memory. Where fork is missing or unsafe
+    (Windows, macOS), workers are spawned and unpickle one copy each at
+    start-up. With n_jobs == 1 the tasks run in the calling process.
+    `func` must be a module-level function.
+    """
+    global _shared
+
+    previous = _shared
+    _shared = shared
+    try:
+        if n_jobs == 1:
+            yield from map(func, *iterables)
+            return
+
+        context = _get_context()
+        initargs = () if context.get_start_method() == 'fork' else (shared,)
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            mp_context=context,
+            initializer=_set_shared if initargs else None,
+            initargs=initargs
+        ) as executor:
+            yield from executor.map(func, *iterables)
+    finally:
+        _shared = previous
+
+
+def get_shared():
+    return _shared
+
+
+def validate_n_jobs(n_jobs, tasks_count):
+    # Negative values count back from the number of CPUs, as in joblib
+    max_workers = os.cpu_count() or 1
+    if n_jobs is None:
+        n_jobs = 1
+    elif n_jobs < 0:
+        n_jobs = max(max_workers + 1 + n_jobs, 1)
+    elif n_jobs == 0:
+        raise ValueError('Argument n_jobs must not be 0')
+
+    return min(n_jobs, max_workers, max(tasks_count, 1))
+
+
+def _get_context():
+    # Fork shares memory for free, but is not available on Windows and not safe on macOS
+    if sys.platform != 'darwin' and 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+
+    return multiprocessing.get_context('spawn')
+
+
+def _set_shared(shared):
+    global _shared
+
+    _shared = shared
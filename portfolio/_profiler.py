@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# Import standard libraries
+import contextlib
+import time
+
+# Import third-party libraries
+import pandas as pd
+
+
+class PhaseProfiler():
+    """
+    Wall time and call counts of the simulation phases.
+
+    Code under `with profiler.phase(name, strategy_type):` is timed and
+    accumulated per (phase, strategy type). Phase contexts can be entered
+    any number of times, so loops bind them once before iterating. A
+    disabled profiler hands out a shared no-op context.
+    """
+
+    _null_phase = contextlib.nullcontext()
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.timings = {}
+
+
+    def phase(self, name, strategy_type=None):
+        if not self.enabled:
+            return self._null_phase
+
+        return _PhaseTimer(self.timings, (name, strategy_type))
+
+
+    def merge(self, timings):
+        # Add timings collected elsewhere, e.g. by pool workers
+        for key, (wall_time, calls) in timings.items():
+            total = self.timings.setdefault(key, [0.0, 0])
+            total[0] += wall_time
+            total[1] += calls
+
+        return self
+
+
+    def reset(self):
+        self.timings = {}
+
+        return self
+
+
+    def to_frame(self):
+        rows = [[name, strategy_type, wall_time, calls] for (name, strategy_type), (wall_time, calls) in self.timings.items()]
+        profile = pd.DataFrame(rows, columns=['phase', 'strategy_type', 'wall_time', 'calls'])
+        profile['time_per_call'] = profile['wall_time'] / profile['calls']
+        profile['share'] = profile['wall_time'] / profile['wall_time'].sum()
+
+        return profile.sort_values(by='wall_time', ascending=False, kind='mergesort').reset_index(drop=True)
+
+
+class _PhaseTimer():
+    __slots__ = ['timings', 'key', 'start']
+
+    def __init__(self, timings, key):
+        self.timings = timings
+        self.key = key
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+        return self
+
+
+    def __exit__(self, *exc_info):
+        total = self.timings.setdefault(self.key, [0.0, 0])
+        total[0] += time.perf_counter() - self.start
+        total[1] += 1
+
+        return False
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+# Import standard libraries
+import logging
+import math
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressTracker():
+    """
+    Builds a progress event for every completed option of a sweep.
+
+    Events are plain dicts, so callbacks can log, store or forward them:
+    options done and total, elapsed seconds, throughput in options per
+    second, ETA in seconds, and the metrics of the latest option with the
+    best value of `metric` so far. Throughput only counts the options run
+    in this session, not the ones loaded from a checkpoint. Sweeps over
+    other items (folds, simulations) name them with `unit`; the event
+    keys stay the same.
+    """
+
+    def __init__(self, total, callback, metric='sharpe_ratio', unit='option'):
+        self.total = total
+        self.callback = callback
+        self.metric = metric
+        self.unit = unit
+        self.done = 0
+        self.start_done = 0
+        self.best_value = math.nan
+        self.best_option = None
+        self.start_time = time.perf_counter()
+
+
+    def load(self, option_nums, values):
+        # Options restored from a checkpoint count as done and compete for the best
+        for option_num, value in zip(option_nums, values):
+            self._update_best(option_num, value)
+
+        self.done = self.start_done = len(option_nums)
+
+        return self
+
+
+    def start(self):
+        return self._emit(None, {})
+
+
+    def update(self, option_num, option_metrics):
+        self.done += 1
+        self._update_best(option_num, option_metrics.get(self.metric, math.nan))
+
+        return self._emit(option_num, option_metrics)
+
+
+    def _update_best(self, option_num, value):
+        if value > self.best_value or (math.isnan(self.best_value) and not math.isnan(value)):
+            self.best_value = value
+            self.best_option = option_num
+
+        return self
+
+
+    def _emit(self, option_num, option_metrics):
+        elapsed = time.perf_counter() - self.start_time
+        run_count = self.done - self.start_done
+        options_per_second = run_count / elapsed if elapsed > 0 else math.nan
+        eta = (self.total - self.done) / options_per_second if run_count else math.nan
+
+        event = {
+            'done': self.done,
+            'total': self.total,
+            'elapsed': elapsed,
+            'options_per_second': options_per_second,
+            'eta': eta,
+            'option': option_num,
+            'metrics': option_metrics,
+            'metric': self.metric,
+            'best_value': self.best_value,
+            'best_option': self.best_option,
+            'unit': self.unit,
+        }
+        self.callback(event)
+
+        return event
+
+
+class LogProgress():
+    """
+    Default progress callback, writing one log line every `interval`
+    seconds at most, plus the first and the last event of a sweep.
+    """
+
+    def __init__(self, interval=10.0, logger=logger, level=logging.INFO):
+        self.interval = interval
+        self.logger = logger
+        self.level = level
+        self.last_time = -math.inf
+
+
+    def __call__(self, event):
+        now = time.perf_counter()
+        is_edge = event['option'] is None or event['done'] == event['total']
+        if not is_edge and now - self.last_time < self.interval:
+            return
+
+        self.last_time = now
+        unit = event.get('unit', 'option')
+        if event['option'] is None:
+            self.logger.log(self.level, f'There are total {event["total"]} {unit}s, {event["done"]} already done')
+            return
+
+        msg1 = f'{event["done"]}/{event["total"]} {unit}s - {event["options_per_second"]:.2f} {unit}s/s - ETA {event["eta"]:.0f}s'
+        msg2 = f'Best {event["metric"]}: {event["best_value"]:.4f} ({unit} {_format_option(event["best_option"])})'
+        self.logger.log(self.level, ' - '.join([msg1, msg2]))
+
+
+def _format_option(option_num):
+    return '-' if option_num is None else option_num + 1
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+# Import standard libraries
+from pathlib import Path
+
+# Import third-party libraries
+import pandas as pd
+import numpy as np
+
+# Import local module
+from quantfin.portfolio._files import atomic_write, validate_format
+
+
+RESULT_FORMATS = ['.parquet', '.feather']
+
+
+class ResultSink():
+    """
+    Columnar accumulator of backtest option results.
+
+    Metrics and the option's index matrix are written into preallocated
+    arrays (one row per option number), so adding a result is O(1).
+    When a path is given, the filled rows are flushed to a Parquet or
+    Feather file every `flush_every` results and can be loaded back to
+    resume an interrupted sweep. Every saved row carries the `fingerprint`
+    of the grid it belongs to, and files of another grid are not loaded.
+    """
+
+    def __init__(self, metric_cols, options_count, idx_width, path=None, flush_every=100, fingerprint=None):
+        self.metric_cols = list(metric_cols)
+        self.idx_cols = [f'idx_{i}' for i in range(idx_width)]
+        self.path = Path(path) if path else None
+        self.flush_every = flush_every
+        self.fingerprint = fingerprint
+        self.metrics = np.full((options_count, len(self.metric_cols)), np.nan)
+        self.idx_matrices = np.zeros((options_count, idx_width), dtype=np.int64)
+        self.filled = np.zeros(options_count, dtype=bool)
+        self._unflushed = 0
+
+        if self.path:
+            validate_format(self.path, RESULT_FORMATS, 'Result')
+
+
+    def add(self, option_num, idx_matrix, metrics):
+        self.metrics[option_num] = metrics
+        self.idx_matrices[option_num] = idx_matrix
+        self.filled[option_num] = True
+        self._unflushed += 1
+
+        if self.path and self.flush_every and self._unflushed >= self.flush_every:
+            self.flush()
+
+        return self
+
+
+    def get_saved_options(self):
+        return np.flatnonzero(self.filled)
+
+
+    def to_frame(self):
+        option_nums = self.get_saved_options()
+        frame = pd.DataFrame(self.metrics[option_nums], columns=self.metric_cols)
+        frame[self.idx_cols] = self.idx_matrices[option_nums]
+        frame.insert(0, 'option', option_nums)
+        if self.fingerprint is not None:
+            frame['fingerprint'] = self.fingerprint
+
+        return frame
+
+
+    def flush(self):
+        if not self.path:
+            return self
+
+        with atomic_write(self.path) as file:
+            _write_frame(self.to_frame(), file, self.path.suffix)
+        self._unflushed = 0
+
+        return self
+
+
+    def load(self, idx_matrices, path=None):
+        # Results of another file, e.g. a shard, can be loaded into the same sink
+        path = Path(path) if path else self.path
+        if not path or not path.exists():
+            return self
+
+        validate_format(path, RESULT_FORMATS, 'Result')
+        frame = _read_frame(path)
+        fingerprint_cols = ['fingerprint'] if self.fingerprint is not None else []
+        missing_cols = [col for col in ['option'] + self.metric_cols + self.idx_cols + fingerprint_cols if col not in frame.columns]
+        if missing_cols:
+            msg1 = f'Checkpoint {path} does not match the current results layout.'
+            msg2 = f'Missing columns: {", ".join(missing_cols)}.'
+            raise ValueError(' '.join([msg1, msg2]))
+
+        option_nums = frame['option'].to_numpy(dtype=np.int64)
+        saved_idx = frame[self.idx_cols].to_numpy(dtype=np.int64)
+        is_other_grid = (option_nums >= len(idx_matrices)).any() or not (np.asarray(idx_matrices)[option_nums] == saved_idx).all()
+        if fingerprint_cols:
+            is_other_grid |= not (frame['fingerprint'] == self.fingerprint).all()
+        if is_other_grid:
+            msg1 = f'Checkpoint {path} was produced by a different strategy grid.'
+            msg2 = 'Remove the file or use another path to start a new sweep.'
+            raise ValueError(' '.join([msg1, msg2]))
+
+        self.metrics[option_nums] = frame[self.metric_cols].to_numpy(dtype=np.float64)
+        self.idx_matrices[option_nums] = saved_idx
+        self.filled[option_nums] = True
+
+        return self
+
+
+def _write_frame(frame, path, file_format):
+    if file_format == '.parquet':
+        frame.to_parquet(path, index=False)
+    else:
+        frame.to_feather(path)
+
+    return
+
+
+def _read_frame(path):
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    else:
+        return pd.read_feather(path)
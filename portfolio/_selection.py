@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+# Import third-party libraries
+import numpy as np
+
+
+def top_k_mask(values, k, tie_breaks=None):
+    """
+    Boolean mask of the values whose descending average rank is <= k.
+
+    This is the selection `pd.Series(values).rank(ascending=False) <= k`
+    without ranking the whole array: the k-th largest value is found with a
+    partial partition, everything above it is selected and its tie group
+    is kept only if the group's average rank is still within k. NaN values
+    are never selected. `values` may be 2-d, in which case every row is an
+    independent selection and k is a scalar or one value per row.
+
+    When `tie_breaks` (same shape as values) is given, the tie group is cut
+    instead: its members with the smallest tie_breaks fill the remaining
+    slots, so exactly floor(k) values are selected when enough are valid.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rows = values.reshape(-1, values.shape[-1])
+    k = np.broadcast_to(np.asarray(k, dtype=np.float64).reshape(-1), (rows.shape[0],))
+
+    is_valid = ~np.isnan(rows)
+    valid_counts = np.count_nonzero(is_valid, axis=1)
+    mask = np.zeros(rows.shape, dtype=bool)
+
+    # Every valid value is within k
+    is_full = k >= valid_counts
+    mask[is_full] = is_valid[is_full]
+
+    # Partial selection around the k-th largest value
+    is_partial = (k >= 1) & ~is_full
+    if is_partial.any():
+        partial_k = k[is_partial]
+        partial_rows = rows[is_partial]
+        kth = np.floor(partial_k).astype(np.int64) - 1
+        partitioned = np.partition(-partial_rows, np.unique(kth), axis=1)
+        kth_vals = -partitioned[np.arange(len(kth)), kth][:, None]
+
+        # Ties with the k-th value share the average rank of their group
+        is_greater = partial_rows > kth_vals
+        is_equal = partial_rows == kth_vals
+        if tie_breaks is None:
+            tie_ranks = np.count_nonzero(is_greater, axis=1) + (np.count_nonzero(is_equal, axis=1) + 1) / 2
+            mask[is_partial] = is_greater | (is_equal & (tie_ranks <= partial_k)[:, None])
+        else:
+            # Order the tie group by tie_breaks and keep the slots left
+            tie_keys = np.where(is_equal, np.asarray(tie_breaks, dtype=np.float64).reshape(rows.shape)[is_partial], np.inf)
+            tie_order = np.argsort(np.argsort(tie_keys, axis=1, kind='stable'), axis=1)
+            slots_left = kth + 1 - np.count_nonzero(is_greater, axis=1)
+            mask[is_partial] = is_greater | (is_equal & (tie_order < slots_left[:, None]))
+
+    return mask.reshape(values.shape)
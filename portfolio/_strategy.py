@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# Import third-party libraries
+import pandas as pd
+import numpy as np
+
+
+COLUMN_TYPES = ['simple_compare', 'double_compare', 'columns_compare']
+STATE_TYPES = ['holding_days', 'trailing_stoploss']
+OPERATIONS = ['>', '>=', '<', '<=', '==', 'in', 'not in']
+
+
+class Predicate():
+    """
+    Compiled strategy spec ({'type', 'col', 'operation', 'threshold'}).
+
+    Column predicates are evaluated against a panel, any mapping from
+    column name to values (a dict of date x symbol arrays, a row of the
+    pivoted data, ...), and state predicates against the holding days or
+    trailing P&L array of the simulation. `threshold_idx` selects one of
+    the spec's thresholds; an array of indices evaluates a batch of
+    thresholds at once, stacked along a new leading axis.
+    """
+
+    def __init__(self, strat):
+        self.type = strat['type']
+        self.col = strat['col']
+        self.operation = strat['operation']
+        self.thresholds = list(strat['threshold'])
+        self.is_stateful = self.type in STATE_TYPES
+        self.fields = self._get_fields()
+
+
+    def evaluate(self, values, threshold_idx):
+        if np.ndim(threshold_idx) > 0:
+            return self._evaluate_batch(values, np.asarray(threshold_idx))
+
+        threshold = self.thresholds[threshold_idx]
+        if self.type == 'simple_compare':
+            return compare(values[self.col], threshold, self.operation)
+
+        elif self.type == 'double_compare':
+            compare_result1 = compare(values[self.col[0]], threshold[0], self.operation[0])
+            compare_result2 = compare(values[self.col[1]], threshold[1], self.operation[1])
+            return compare_result1 | compare_result2
+
+        elif self.type == 'columns_compare':
+            return compare(values[self.col], values[threshold], self.operation)
+
+        elif self.type == 'holding_days':
+            return compare(values, threshold, self.operation)
+
+        elif self.type == 'trailing_stoploss':
+            return compare(1/values, 1/(1 - threshold), self.operation)
+
+
+    def get_key(self, threshold_idx):
+        # Identical specs share the same key, whichever strategy list they come from
+        return (self.type, repr(self.col), repr(self.operation), repr(self.thresholds[threshold_idx]))
+
+
+    def _evaluate_batch(self, values, threshold_idxs):
+        if self.type == 'holding_days':
+            thresholds = np.array([self.thresholds[i] for i in threshold_idxs])[:, None]
+            return compare(values, thresholds, self.operation)
+
+        elif self.type == 'trailing_stoploss':
+            thresholds = np.array([1/(1 - self.thresholds[i]) for i in threshold_idxs])[:, None]
+            return compare(1/values, thresholds, self.operation)
+
+        # One evaluation per distinct threshold, broadcast to the rows using it
+        unique_idxs, row_pos = np.unique(threshold_idxs, return_inverse=True)
+        results = np.stack([np.asarray(self.evaluate(values, i)) for i in unique_idxs])
+
+        return results[row_pos]
+
+
+    def _get_fields(self):
+        if self.type == 'simple_compare':
+            return [self.col]
+        elif self.type == 'double_compare':
+            return list(self.col)
+        elif self.type == 'columns_compare':
+            return [self.col] + self.thresholds
+
+        return []
+
+
+def compile_strategies(strats, columns=None):
+    """
+    Validate strategy specs and compile them into predicates.
+
+    When `columns` is given, every column a spec references must be in it.
+    """
+    predicates = []
+    for strat in strats:
+        _validate_strat(strat)
+        predicates.append(Predicate(strat))
+
+    if columns is not None:
+        fields = [field for predicate in predicates for field in predicate.fields]
+        missing_fields = list(dict.fromkeys(field for field in fields if field not in columns))
+        if missing_fields:
+            msg1 = 'Columns referenced by the strategies are missing from the data.'
+            msg2 = f'Missing columns: {", ".join(map(str, missing_fields))}.'
+            raise ValueError(' '.join([msg1, msg2]))
+
+    return predicates
+
+
+def compare(val, threshold, operation):
+    if operation == '>':
+        return val > threshold
+    elif operation == '>=':
+        return val >= threshold
+    elif operation == '<':
+        return val < threshold
+    elif operation == '<=':
+        return val <= threshold
+    elif operation == '==':
+        return val == threshold
+    elif operation == 'in':
+        if isinstance(val, pd.Series):
+            return val.isin(threshold)
+        return np.isin(val, threshold)
+    elif operation == 'not in':
+        if isinstance(val, pd.Series):
+            return ~val.isin(threshold)
+        return ~np.isin(val, threshold)
+
+
+def _validate_strat(strat):
+    missing_keys = [key for key in ['type', 'col', 'operation', 'threshold'] if key not in strat]
+    if missing_keys:
+        msg1 = f'Strategy {strat} is incomplete.'
+        msg2 = f'Missing keys: {", ".join(missing_keys)}.'
+        raise ValueError(' '.join([msg1, msg2]))
+
+    strat_types = COLUMN_TYPES + STATE_TYPES
+    if strat['type'] not in strat_types:
+        msg1 = f'Strategy type {strat["type"]} is not recognized.'
+        msg2 = f'Available types: {", ".join(strat_types)}.'
+        raise ValueError(' '.join([msg1, msg2]))
+
+    operations = strat['operation'] if strat['type'] == 'double_compare' else [strat['operation']]
+    for operation in operations:
+        if operation not in OPERATIONS:
+            msg1 = f'Operation {operation} is not recognized.'
+            msg2 = f'Available operations: {", ".join(OPERATIONS)}.'
+            raise ValueError(' '.join([msg1, msg2]))
+
+    if not len(strat['threshold']):
+        raise ValueError(f'Strategy {strat} has no thresholds')
+
+    return strat
@@ -1,22 +1,362 @@
 # -*- coding: utf-8 -*-
 
+# Import standard libraries
+import glob
+import hashlib
+import itertools
+import json
+from pathlib import Path
+
 # Import third-party libraries
 import pandas as pd
 import numpy as np
-import itertools
 
 # Import local module
 import quantfin.portfolio.evaluation as eval
+import quantfin.portfolio.metrics as metrics
+from quantfin.portfolio._ledger import TradeLedger, LedgerRecorder, SimulationState
+from quantfin.portfolio._pool import map_shared, get_shared, validate_n_jobs
+from quantfin.portfolio._profiler import PhaseProfiler
+from quantfin.portfolio._progress import ProgressTracker, LogProgress
+from quantfin.portfolio._results import ResultSink
+from quantfin.portfolio._selection import top_k_mask
+from quantfin.portfolio._strategy import compile_strategies
+from quantfin.portfolio.screener import screen_pairs
+from quantfin.preprocessing.panel import PanelStore, factorize_panel_keys
+
+
+# Cells per dense block of daily returns, bounding memory on wide panels
+DENSE_CHUNK_CELLS = 2 ** 20
+
 
 class MeanRevert():
-    def __init__(self, dataframe):
+    """
+    Pairs and baskets mean-reversion backtester.
+
+    Candidates are screened on the first `formation_days` dates: pairs with
+    the Engle-Granger test of screener.screen_pairs, after a prefilter on
+    the correlation of log prices (`min_corr`), baskets with the Johansen
+    test, keeping the spreads whose half-life is between 1 and
+    `max_half_life` dates. Every selected spread is then traded on the
+    following dates for every (lookback, entry_z, exit_z) combination: long
+    the spread when its rolling z-score falls below -entry_z, short above
+    entry_z, flat once it is back within exit_z. All spreads and
+    combinations are simulated at once as columns of date x spread arrays.
+    """
+
+    def __init__(
+        self,
+        dataframe,
+        symbol_col='symbol',
+        date_col='date',
+        price_col='adj_close',
+        formation_days=252,
+        lookback=[20],
+        entry_z=[2],
+        exit_z=[0.5],
+        max_half_life=63,
+        alpha=0.05,
+        min_corr=0.8
+    ):
         self.data = dataframe
+        self.symbol_col = symbol_col
+        self.date_col = date_col
+        self.price_col = price_col
+        self.formation_days = formation_days
+        self.lookback = lookback
+        self.entry_z = entry_z
+        self.exit_z = exit_z
+        self.max_half_life = max_half_life
+        self.alpha = alpha
+        self.min_corr = min_corr
+        self.candidates = None
         self.result = pd.DataFrame()
+        self._validate_windows()
+        self._construct_prices()
+    
+
+    def _construct_prices(self):
+        prices = self.data[self.price_col].unstack(self.symbol_col).sort_index()
+        self.dates = prices.index
+        self.symbols = prices.columns
+        self.prices = prices.to_numpy(dtype=np.float64)
+
+        # Only symbols priced on every formation date can be screened
+        self.formation_prices = self.prices[:self.formation_days]
+        self.is_screenable = ~np.isnan(self.formation_prices).any(axis=0)
+
+        # Trading uses the latest known price
+        self.filled_prices = prices.ffill().to_numpy(dtype=np.float64)
+
+        return self
+    
+
+    def screen(self, pairs=None, baskets=None, max_candidates=None, n_jobs=1):
+        """
+        Select the cointegrated spreads of the formation period.
+
+        `pairs` defaults to every pair of screenable symbols, `baskets` is
+        an optional list of symbol lists. Engle-Granger tests of the pairs
+        and Johansen tests of the baskets run over `n_jobs` workers. When
+        given, only the `max_candidates` fastest reverting pairs are kept.
+        """
+        candidates = self._screen_pairs(pairs, max_candidates, n_jobs)
+        if baskets:
+            candidates = pd.concat([candidates, self._screen_baskets(baskets, n_jobs)], ignore_index=True)
+        
+        self.candidates = candidates.reset_index(drop=True)
+
+        return self.candidates
+    
+
+    def _screen_pairs(self, pairs, max_candidates, n_jobs=1):
+        formation_prices = pd.DataFrame(self.formation_prices[:, self.is_screenable], columns=self.symbols[self.is_screenable])
+        screened = screen_pairs(
+            formation_prices,
+            min_corr=-np.inf if self.min_corr is None else self.min_corr,
+            pairs=pairs,
+            alpha=self.alpha,
+            max_half_life=self.max_half_life,
+            n_jobs=n_jobs
+        )
+
+        # Fastest reverting pairs first
+        screened = screened[screened['half_life'] >= 1].sort_values(by='half_life', kind='mergesort')
+        if max_candidates:
+            screened = screened.iloc[:max_candidates]
+        
+        return pd.DataFrame({
+            'legs': list(zip(screened['symbol1'], screened['symbol2'])),
+            'weights': [(1.0, -hedge_ratio) for hedge_ratio in screened['hedge_ratio']],
+            'half_life': screened['half_life'].to_numpy(dtype=np.float64),
+        }, columns=['legs', 'weights', 'half_life'])
+    
+
+    def _screen_baskets(self, baskets, n_jobs=1):
+        baskets = [basket for basket in baskets if (self.symbols.get_indexer(basket) >= 0).all()]
+        baskets = [basket for basket in baskets if self.is_screenable[self.symbols.get_indexer(basket)].all()]
+        formation_prices = pd.DataFrame(self.formation_prices, columns=self.symbols)
+        results = eval.johansen_test_batch(formation_prices, baskets, alpha=self.alpha, n_jobs=n_jobs)
+
+        # The first eigenvector gives the basket weights, scaled to a unit first leg
+        rows = []
+        for basket, pass_test, eigenvectors, half_lives in results.itertuples(index=False):
+            if pass_test and 1 <= half_lives[0] <= self.max_half_life:
+                rows.append([tuple(basket), tuple(eigenvectors[:, 0] / eigenvectors[0, 0]), half_lives[0]])
+        
+        return pd.DataFrame(rows, columns=['legs', 'weights', 'half_life'])
+    
+
+    def run(self, pairs=None, baskets=None, max_candidates=None, n_jobs=1):
+        if self.candidates is None or pairs is not None or baskets is not None:
+            self.screen(pairs, baskets, max_candidates, n_jobs)
+        
+        grid = list(itertools.product(self.lookback, self.entry_z, self.exit_z))
+        result_cols = ['legs', 'weights', 'half_life', 'lookback', 'entry_z', 'exit_z'] + self.metric_cols
+        if not len(self.candidates) or len(self.dates) <= self.formation_days:
+            self.result = pd.DataFrame(columns=result_cols)
+            return self.result
+        
+        # Spread and gross exposure of every candidate, one matrix multiply each
+        weight_matrix = np.zeros((len(self.symbols), len(self.candidates)))
+        for spread_num, (legs, weights) in enumerate(zip(self.candidates['legs'], self.candidates['weights'])):
+            weight_matrix[self.symbols.get_indexer(legs), spread_num] = weights
+        
+        prices = np.nan_to_num(self.filled_prices)
+        spreads = prices @ weight_matrix
+        gross = np.abs(prices) @ np.abs(weight_matrix)
+
+        # One column per (candidate, lookback, entry_z, exit_z)
+        z_scores = np.hstack([_get_rolling_z_scores(spreads, lookback) for lookback, _, _ in grid])
+        entry_z = np.repeat([entry_z for _, entry_z, _ in grid], len(self.candidates))
+        exit_z = np.repeat([exit_z for _, _, exit_z in grid], len(self.candidates))
+        positions = self._simulate_spreads(z_scores, entry_z, exit_z)
+
+        # Positions taken at a close earn the next date's spread change
+        spread_changes = np.tile(np.diff(spreads, axis=0), len(grid))
+        tiled_gross = np.tile(gross[:-1], len(grid))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.where(positions[:-1] != 0, positions[:-1] * spread_changes / tiled_gross, 0)
+        returns = returns[self.formation_days - 1:].T
+
+        option_metrics = metrics.get_return_metrics(returns)
+        trading_positions = positions[self.formation_days - 1:-1]
+        option_metrics['exposure'] = (trading_positions != 0).mean(axis=0)
+        option_metrics['trade_count'] = ((trading_positions != 0) & (np.diff(trading_positions, axis=0, prepend=0) != 0)).sum(axis=0)
+
+        self.result = pd.DataFrame({
+            'legs': np.tile(self.candidates['legs'].to_numpy(), len(grid)),
+            'weights': np.tile(self.candidates['weights'].to_numpy(), len(grid)),
+            'half_life': np.tile(self.candidates['half_life'].to_numpy(), len(grid)),
+            'lookback': np.repeat([lookback for lookback, _, _ in grid], len(self.candidates)),
+            'entry_z': entry_z,
+            'exit_z': exit_z,
+        })
+        for col in self.metric_cols:
+            self.result[col] = option_metrics[col]
+        
+        return self.result
+    
+
+    @property
+    def metric_cols(self):
+        return ['cumm_return', 'sharpe_ratio', 'sortino_ratio', 'max_drawdown', 'max_drawdown_days', 'exposure', 'trade_count']
+    
+
+    def _simulate_spreads(self, z_scores, entry_z, exit_z):
+        # Hysteresis needs the previous position, so dates are stepped in order
+        positions = np.zeros(z_scores.shape, dtype=np.int8)
+        current_positions = np.zeros(z_scores.shape[1], dtype=np.int8)
+        for date_idx in range(self.formation_days - 1, len(z_scores)):
+            z_score = z_scores[date_idx]
+            is_exit = ((current_positions > 0) & (z_score >= -exit_z)) | ((current_positions < 0) & (z_score <= exit_z))
+            current_positions = np.where(is_exit | np.isnan(z_score), 0, current_positions)
+            is_flat = current_positions == 0
+            current_positions[is_flat & (z_score < -entry_z)] = 1
+            current_positions[is_flat & (z_score > entry_z)] = -1
+            positions[date_idx] = current_positions
+        
+        return positions
+    
+
+    def _validate_windows(self):
+        if self.formation_days < 2 or max(self.lookback) > self.formation_days:
+            msg1 = f'Formation period of {self.formation_days} dates is not valid.'
+            msg2 = 'It must cover at least 2 dates and the longest z-score lookback.'
+            raise ValueError(' '.join([msg1, msg2]))
+        
+        if any(exit_z >= entry_z for entry_z, exit_z in itertools.product(self.entry_z, self.exit_z)):
+            raise ValueError('Every exit_z must be lower than every entry_z')
+        
+        return
+
 
 class Momentum():
-    def __init__(self, dataframe):
+    """
+    Cross-sectional momentum backtester.
+
+    Symbols are ranked on their return over `lookback` dates, ending
+    `skip_days` dates before the ranking date, and the top `top_quantile`
+    of the ranked universe is held with equal weights for `holding_days`
+    dates. Rankings of all dates are computed in one vectorized pass per
+    (lookback, skip_days); each holding period reads its rebalance dates
+    from them. Every combination is evaluated from the same first date,
+    the first one all lookbacks can rank.
+    """
+
+    def __init__(
+        self,
+        dataframe,
+        symbol_col='symbol',
+        date_col='date',
+        price_col='adj_close',
+        lookback=[63, 126, 252],
+        holding_days=[21],
+        skip_days=[21],
+        top_quantile=0.1,
+        min_symbols=10
+    ):
         self.data = dataframe
+        self.symbol_col = symbol_col
+        self.date_col = date_col
+        self.price_col = price_col
+        self.lookback = lookback
+        self.holding_days = holding_days
+        self.skip_days = skip_days
+        self.top_quantile = top_quantile
+        self.min_symbols = min_symbols
+        self.metric_cols = ['cumm_return', 'sharpe_ratio', 'sortino_ratio', 'max_drawdown', 'max_drawdown_days', 'turnover', 'avg_holdings', 'trade_count']
         self.result = pd.DataFrame()
+        self._validate_params()
+        self._construct_prices()
+    
+
+    def _construct_prices(self):
+        prices = self.data[self.price_col].unstack(self.symbol_col).sort_index()
+        self.dates = prices.index
+        self.symbols = prices.columns
+        self.is_listed = prices.notna().to_numpy()
+
+        # Returns over the latest known prices, NaN before the listing date
+        self.filled_prices = prices.ffill().to_numpy(dtype=np.float64)
+        self.daily_rets = np.full(self.filled_prices.shape, np.nan)
+        self.daily_rets[1:] = self.filled_prices[1:] / self.filled_prices[:-1] - 1
+
+        return self
+    
+
+    def run(self):
+        grid = list(itertools.product(self.lookback, self.holding_days, self.skip_days))
+        start_idx = max(self.lookback) + max(self.skip_days)
+        if start_idx >= len(self.dates) - 1:
+            msg1 = f'Data has {len(self.dates)} dates, fewer than the longest lookback and skip period.'
+            msg2 = f'At least {start_idx + 2} dates are required.'
+            raise ValueError(' '.join([msg1, msg2]))
+        
+        selections = {}
+        returns = np.zeros((len(grid), len(self.dates) - start_idx - 1))
+        holding_counts = np.zeros(returns.shape)
+        changes = np.zeros(returns.shape)
+        trade_counts = np.zeros(len(grid), dtype=np.int64)
+        for option_num, (lookback, holding_days, skip_days) in enumerate(grid):
+            if (lookback, skip_days) not in selections:
+                selections[(lookback, skip_days)] = self._get_selections(lookback, skip_days)
+            
+            # Holdings of every date are the selection of its latest rebalance date
+            date_idx = np.arange(start_idx, len(self.dates) - 1)
+            rebalance_idx = start_idx + (date_idx - start_idx) // holding_days * holding_days
+            holdings = selections[(lookback, skip_days)][rebalance_idx]
+
+            # Positions taken at a close earn the next date's return
+            held_counts = np.count_nonzero(holdings, axis=1)
+            held_rets = np.where(holdings, np.nan_to_num(self.daily_rets[date_idx + 1]), 0).sum(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                returns[option_num] = np.where(held_counts > 0, held_rets / held_counts, 0)
+            
+            is_changed = np.diff(holdings, axis=0, prepend=np.zeros((1, holdings.shape[1]), dtype=bool))
+            holding_counts[option_num] = held_counts
+            changes[option_num] = np.count_nonzero(is_changed, axis=1)
+            trade_counts[option_num] = np.count_nonzero(is_changed & holdings)
+        
+        # Calculate trading results
+        option_metrics = {'trade_count': trade_counts}
+        option_metrics.update(metrics.get_return_metrics(returns))
+        option_metrics['turnover'] = metrics.get_position_metrics(holding_counts, changes, holding_counts.mean(axis=1))['turnover']
+        option_metrics['avg_holdings'] = holding_counts.mean(axis=1)
+
+        self.result = pd.DataFrame(grid, columns=['lookback', 'holding_days', 'skip_days'])
+        for col in self.metric_cols:
+            self.result[col] = option_metrics[col]
+        
+        return self.result
+    
+
+    def _get_selections(self, lookback, skip_days):
+        # Formation returns of every date and symbol, for symbols still listed on the date
+        momentum = np.full(self.filled_prices.shape, np.nan)
+        end_prices = self.filled_prices[lookback:len(self.dates) - skip_days]
+        start_prices = self.filled_prices[:len(self.dates) - skip_days - lookback]
+        momentum[lookback + skip_days:] = end_prices / start_prices - 1
+        momentum[~self.is_listed] = np.nan
+
+        # Top quantile of every date at once, dates with a thin universe stay in cash
+        valid_counts = np.count_nonzero(~np.isnan(momentum), axis=1)
+        k = np.where(valid_counts >= self.min_symbols, np.maximum(np.floor(valid_counts * self.top_quantile), 1), 0)
+
+        return top_k_mask(momentum, k)
+    
+
+    def _validate_params(self):
+        if not 0 < self.top_quantile <= 1:
+            raise ValueError('Argument top_quantile must be in (0, 1]')
+        
+        if min(self.lookback) < 1 or min(self.holding_days) < 1 or min(self.skip_days) < 0:
+            msg1 = 'Lookbacks and holding periods must be positive.'
+            msg2 = 'Skip periods must not be negative.'
+            raise ValueError(' '.join([msg1, msg2]))
+        
+        return
+
 
 class Backtest():
     def __init__(
@@ -89,7 +429,10 @@ class Backtest():
         ],
         portfolio_size=[25],
         low_risk_prop=[0.25],
-        min_holding_days=3
+        min_holding_days=3,
+        engine='pandas',
+        pack_signals=False,
+        batch_size=1
     ):
         self.data = dataframe
         self.symbol_col = symbol_col
@@ -104,25 +447,127 @@ class Backtest():
         self.portfolio_size = portfolio_size
         self.low_risk_prop = low_risk_prop
         self.min_holding_days = min_holding_days
+        self.engine = self._validate_engine(engine)
+        self.pack_signals = pack_signals
+        self.batch_size = self._validate_batch_size(batch_size)
+        self.keep_ledgers = False
+        self.trade_ledgers = {}
+        self.tie_breaker = None
+        self.profiler = PhaseProfiler()
+        self.profile_results = None
+        self._compile_strategies()
         self._construct_pivoted_df()
         self._construct_backtest_results()
+
+        if self.engine == 'numpy':
+            self._construct_arrays()
+            self._construct_signal_masks()
+    
+
+    def _compile_strategies(self):
+        # Strategies may also reference the daily returns computed below
+        columns = list(self.data.columns) + ['daily_ret']
+        self.buy_predicates = compile_strategies(self.buy_strats, columns)
+        self.sell_predicates = compile_strategies(self.sell_strats, columns)
+
+        return self
     
 
     def _construct_pivoted_df(self):
+        if isinstance(self.data, PanelStore):
+            return self._construct_panel_df()
+        
         self.data['daily_ret'] = self.data.groupby(self.symbol_col)[self.price_col].pct_change()
-        self.pivoted_data = pd.pivot_table(self.data, values=self.data.columns, index=self.date_col, columns=[self.symbol_col])
+        fields = self._get_referenced_fields()
+        self._validate_fields(fields, self.data.columns)
+
+        # Factorize (date, symbol) keys into row and column positions
+        date_codes, dates, symbol_codes, symbols, is_valid = factorize_panel_keys(self.data, self.symbol_col, self.date_col)
+
+        # Scatter every field into one preallocated date x (field, symbol) array
+        pivoted_values = np.full((len(dates), len(fields), len(symbols)), np.nan)
+        for field_idx, field in enumerate(fields):
+            pivoted_values[date_codes, field_idx, symbol_codes] = self.data[field].to_numpy(dtype=np.float64)[is_valid]
+
+        self.pivoted_data = pd.DataFrame(
+            data=pivoted_values.reshape(len(dates), -1),
+            index=pd.Index(dates, name=self.date_col),
+            columns=pd.MultiIndex.from_product([fields, pd.Index(symbols, name=self.symbol_col)])
+        )
+        self.symbols = self.data.index.get_level_values(self.symbol_col).unique()
+
+        # Daily returns aligned to the trading logs, summed in pivoted column order
+        self.daily_rets = np.ascontiguousarray(self.pivoted_data[self.daily_ret_col].reindex(columns=self.symbols).to_numpy(dtype=np.float64))
+        self.symbols_order = np.argsort(np.argsort(self.symbols))
 
         return self
     
 
+    def _construct_panel_df(self):
+        # Panel fields are already date x symbol arrays in sorted symbol order
+        self.panel_arrays = {'daily_ret': self.data.pct_change(self.price_col)}
+        fields = self._get_referenced_fields()
+        self._validate_fields(fields, list(self.data.columns) + list(self.panel_arrays))
+        self.symbols = self.data.symbols
+        self.symbols_order = np.argsort(np.argsort(self.symbols))
+        self.daily_rets = np.ascontiguousarray(self._get_panel_field(self.daily_ret_col))
+
+        # The NumPy engine reads the memory-mapped fields directly, only the pandas engine needs them pivoted
+        if self.engine != 'pandas':
+            fields = [self.daily_ret_col]
+        
+        pivoted_values = np.stack([self._get_panel_field(field) for field in fields], axis=1)
+        self.pivoted_data = pd.DataFrame(
+            data=pivoted_values.reshape(len(self.data), -1),
+            index=self.data.get_dates(),
+            columns=pd.MultiIndex.from_product([fields, self.symbols])
+        )
+
+        return self
+    
+
+    def _get_panel_field(self, field):
+        if field in self.panel_arrays:
+            return self.panel_arrays[field]
+        
+        return self.data[field]
+    
+
+    def _construct_arrays(self):
+        # Dense date x symbol arrays, columns ordered as the trading logs
+        self.arrays = {}
+        for field in self._get_referenced_fields():
+            if isinstance(self.data, PanelStore):
+                self.arrays[field] = self._get_panel_field(field)
+                continue
+            
+            values = self.pivoted_data[field].reindex(columns=self.symbols).to_numpy(dtype=np.float64)
+            self.arrays[field] = np.ascontiguousarray(values)
+
+        return self
+    
+
+    def _get_referenced_fields(self):
+        # Columns referenced by the simulation
+        fields = [self.price_col, self.daily_ret_col, self.pred_col, self.pred_proba_col, self.vol_col]
+        for predicate in self.buy_predicates + self.sell_predicates:
+            fields.extend(predicate.fields)
+
+        return sorted(dict.fromkeys(fields))
+    
+
     def _construct_backtest_results(self):
         # Define columns
         buy_strats_cols = ['_'.join([str(strat['col']), str(strat['operation'])]) for strat in self.buy_strats]
         sell_strats_cols = ['_'.join([str(strat['col']), str(strat['operation'])]) for strat in self.sell_strats if strat['type'] not in ['holding_days', 'trailing_stoploss']]
         sell_strats_cols_2 = ['_'.join([str(strat['type']), str(strat['operation'])]) for strat in self.sell_strats if strat['type'] in ['holding_days', 'trailing_stoploss']]
         sell_strats_cols.extend(sell_strats_cols_2)
-        extra_cols = ['cumm_return', 'sharpe_ratio', 'trade_count', 'portfolio_size', 'low_risk_prop']
-        all_cols = extra_cols + buy_strats_cols + sell_strats_cols
+        self.metric_cols = [
+            'cumm_return', 'sharpe_ratio', 'sortino_ratio', 'max_drawdown', 'max_drawdown_days',
+            'turnover', 'hit_rate', 'exposure', 'avg_holding_days', 'trade_count'
+        ]
+        self.param_cols = ['portfolio_size', 'low_risk_prop'] + buy_strats_cols + sell_strats_cols
+        all_cols = self.metric_cols + self.param_cols
 
         # Create dataframe
         self.backtest_results = pd.DataFrame(columns=all_cols)
@@ -130,34 +575,592 @@ class Backtest():
         return self
 
     
-    def run(self):
-        pd.set_option('display.width', 1000)
+    def run(self, n_jobs=1, results_path=None, flush_every=100, resume=False, keep_ledgers=False, profile=False, progress=None, progress_metric='sharpe_ratio', shard=None):
+        idx_matrices = self._get_index_matrices()
+        shard_options = self._get_shard_options(len(idx_matrices), shard)
+        n_jobs = validate_n_jobs(n_jobs, len(shard_options))
+        
+        if resume and not results_path:
+            raise ValueError('Argument results_path must be specified to resume a sweep')
+        
+        # Columnar result buffers, checkpointed to results_path
+        self.result_sink = ResultSink(
+            self.metric_cols,
+            len(idx_matrices),
+            len(idx_matrices[0]),
+            results_path,
+            flush_every,
+            self._get_grid_fingerprint()
+        )
+        if resume:
+            self.result_sink.load(idx_matrices)
+        
+        saved_options = set(self.result_sink.get_saved_options())
+        pending_options = [i for i in shard_options if i not in saved_options]
+        pending_matrices = [idx_matrices[i] for i in pending_options]
+        
+        # Progress events go to the callback, throttled log lines by default
+        progress_metric = self._validate_metric(progress_metric)
+        progress_tracker = ProgressTracker(len(shard_options), progress or LogProgress(), progress_metric)
+        saved_nums = sorted(saved_options)
+        progress_tracker.load(saved_nums, self.result_sink.metrics[saved_nums, self.metric_cols.index(progress_metric)])
+        progress_tracker.start()
+
+        # Trade ledgers are only sent back from the simulations when requested
+        self.keep_ledgers = keep_ledgers
+        self.trade_ledgers = {}
+
+        # Phase timings are only collected when requested
+        self.profiler = PhaseProfiler(enabled=profile)
+
+        if n_jobs > 1:
+            option_results = self._run_pool(pending_matrices, n_jobs)
+        else:
+            option_results = self._run_options(pending_matrices)
+
+        try:
+            for option_num, (consolidated_results, trade_ledger) in zip(pending_options, option_results):
+                # Consolidate with all backtest results
+                with self.profiler.phase('consolidation'):
+                    self._consolidate_returns(option_num, idx_matrices[option_num], consolidated_results)
+                if keep_ledgers:
+                    self.trade_ledgers[option_num] = trade_ledger
+                
+                # Report new result
+                progress_tracker.update(option_num, dict(zip(self.metric_cols, consolidated_results)))
+        finally:
+            # Keep whatever was completed, even if the sweep is interrupted
+            self.result_sink.flush()
+            self.keep_ledgers = False
+            if profile:
+                self.profile_results = self.profiler.to_frame()
+            self.profiler.enabled = False
+        
+        self.backtest_results = self._get_backtest_results(idx_matrices)
+        
+        return self.backtest_results
+    
+
+    def merge_results(self, paths, allow_missing=False):
+        """
+        Combine the partial result files of a sharded sweep.
+
+        Every shard is run with run(shard=(i, N), results_path=...), on any
+        machine sharing the same data and strategy grid. `paths` is a list
+        of result files or a glob pattern. Files from a different grid are
+        rejected, and options missing from every file raise an error unless
+        `allow_missing` is set.
+        """
+        idx_matrices = self._get_index_matrices()
+        if isinstance(paths, (str, Path)):
+            paths = sorted(glob.glob(str(paths)))
+        
+        if not paths:
+            raise ValueError('No result files to merge')
+        
+        self.result_sink = ResultSink(self.metric_cols, len(idx_matrices), len(idx_matrices[0]), fingerprint=self._get_grid_fingerprint())
+        for path in paths:
+            self.result_sink.load(idx_matrices, path)
+        
+        missing_count = len(idx_matrices) - len(self.result_sink.get_saved_options())
+        if missing_count and not allow_missing:
+            msg1 = f'{missing_count} of {len(idx_matrices)} options are missing from the result files.'
+            msg2 = 'Run the missing shards or set allow_missing=True.'
+            raise ValueError(' '.join([msg1, msg2]))
+        
+        self.backtest_results = self._get_backtest_results(idx_matrices)
+        
+        return self.backtest_results
+    
+
+    def search(self, metric='sharpe_ratio', min_dates=252, eta=3, n_jobs=1, progress=None):
+        """
+        Successive-halving search over the strategy grid.
+
+        All options are first simulated on the earliest `min_dates` dates.
+        Only the best 1/eta of them by `metric` survive to the next stage,
+        whose horizon is eta times longer, until the survivors are run on
+        the full history. Returns a report with each option's last metrics,
+        its survival stage and the number of dates it was evaluated on.
+        Progress events of every stage go to the `progress` callback, as in
+        run(), throttled log lines by default.
+
+        With the numpy engine, survivors continue their simulation from
+        where the previous stage stopped instead of starting over, so only
+        the new dates are simulated. Their metrics are still computed over
+        the whole horizon.
+        """
+        metric = self._validate_metric(metric)
+        if eta < 2:
+            raise ValueError('Argument eta must equal or be greater than 2')
+        
+        idx_matrices = self._get_index_matrices()
+        n_jobs = validate_n_jobs(n_jobs, len(idx_matrices))
+        horizons = self._get_search_horizons(min_dates, eta)
+        metric_pos = self.metric_cols.index(metric)
+
+        search_metrics = np.full((len(idx_matrices), len(self.metric_cols)), np.nan)
+        survival_stage = np.zeros(len(idx_matrices), dtype=np.int64)
+        survivors = list(range(len(idx_matrices)))
+        states = {}
+        progress = progress or LogProgress()
+
+        for stage, end_idx in enumerate(horizons):
+            # Every stage is tracked on its own, its metrics only compare within its horizon
+            progress_tracker = ProgressTracker(len(survivors), progress, metric)
+            progress_tracker.start()
+
+            stage_matrices = [idx_matrices[i] for i in survivors]
+            option_results = self._run_search_stage(stage_matrices, [states.get(i) for i in survivors], end_idx, n_jobs)
+            
+            for option_num, (consolidated_results, state) in zip(survivors, option_results):
+                search_metrics[option_num] = consolidated_results
+                survival_stage[option_num] = stage
+                states[option_num] = state
+                progress_tracker.update(option_num, dict(zip(self.metric_cols, consolidated_results)))
+            
+            if stage == len(horizons) - 1:
+                break
+            
+            # Keep the top 1/eta options, undefined scores rank last
+            scores = np.nan_to_num(search_metrics[survivors, metric_pos], nan=-np.inf)
+            keep_count = max(int(np.ceil(len(survivors) / eta)), 1)
+            ranking = np.argsort(-scores, kind='mergesort')[:keep_count]
+            survivors = sorted(survivors[i] for i in ranking)
+            states = {i: states[i] for i in survivors}
+        
+        # Consolidate search report
+        option_nums = np.arange(len(idx_matrices))
+        params = [self._get_option_params(idx_matrix) for idx_matrix in idx_matrices]
+        search_results = pd.DataFrame(search_metrics, columns=self.metric_cols, index=option_nums)
+        search_results[['max_drawdown_days', 'trade_count']] = search_results[['max_drawdown_days', 'trade_count']].astype(np.int64)
+        search_results[self.param_cols] = pd.DataFrame(params, columns=self.param_cols, index=option_nums)
+        search_results['survival_stage'] = survival_stage
+        search_results['dates_evaluated'] = np.asarray(horizons)[survival_stage]
+        search_results.index.name = 'option'
+
+        self.search_results = search_results.sort_values(by=['survival_stage', metric], ascending=False, kind='mergesort')
+
+        return self.search_results
+    
+
+    def _run_search_stage(self, idx_matrices, states, end_idx, n_jobs):
+        # Yields the metrics and simulation state of every option. The pandas engine has
+        # no state to continue from, and simulates again from the first date
+        if self.engine != 'numpy':
+            if n_jobs > 1:
+                option_results = self._run_pool(idx_matrices, n_jobs, end_idx)
+            else:
+                option_results = self._run_options(idx_matrices, end_idx)
+            
+            return ((consolidated_results, None) for consolidated_results, _ in option_results)
+        
+        if n_jobs > 1:
+            return self._run_pool(idx_matrices, n_jobs, end_idx, states=states)
+        
+        return self._run_stage(idx_matrices, end_idx, states)
+    
+
+    def _run_stage(self, idx_matrices, end_idx, states):
+        # Options are stepped in batches from their states, the first date when None
+        for start in range(0, len(idx_matrices), self.batch_size):
+            batch_matrices = idx_matrices[start:start + self.batch_size]
+            batch_states = states[start:start + self.batch_size]
+            if batch_states[0] is None:
+                state = SimulationState.start((len(batch_matrices), len(self.symbols)), self.min_holding_days)
+            else:
+                state = SimulationState.concat(batch_states)
+            
+            option_results = self._run_batch(batch_matrices, end_idx, state=state)
+            for (consolidated_results, _), option_state in zip(option_results, state.split()):
+                yield consolidated_results, option_state
+    
+
+    def _get_search_horizons(self, min_dates, eta):
+        # End date index of each stage, growing by eta until the full history
+        df_len = len(self.pivoted_data)
+        horizons = []
+        end_idx = self.min_holding_days + min_dates
+        while end_idx < df_len:
+            horizons.append(end_idx)
+            end_idx = self.min_holding_days + (end_idx - self.min_holding_days) * eta
+        horizons.append(df_len)
+
+        return horizons
+    
+
+    def walk_forward(self, metric='sharpe_ratio', train_years=1, expanding=False, n_jobs=1, progress=None):
+        """
+        Walk-forward evaluation of the strategy grid over calendar years.
+
+        Every fold selects the best option by `metric` on its training
+        window, the `train_years` years before the test year (or all years
+        before it when `expanding`), then reports that option's metrics on
+        the test year. All windows index into the same pivoted arrays, and
+        with n_jobs > 1 they are simulated in parallel. Every fold's test
+        metrics are reported to the `progress` callback as soon as its
+        windows are done. Returns the per-fold report; aggregated test
+        metrics are kept in walk_forward_summary.
+        """
+        metric = self._validate_metric(metric)
+        if train_years < 1:
+            raise ValueError('Argument train_years must equal or be greater than 1')
+        
+        idx_matrices = self._get_index_matrices()
+        folds = self._get_walk_forward_folds(train_years, expanding)
+        if not folds:
+            raise ValueError(f'Data must span more than {train_years} years for a walk-forward run')
+        
+        # Train and test windows in fold order, shared by folds where they coincide
+        windows = list(dict.fromkeys(itertools.chain.from_iterable(
+            [(train_start, test_start), (test_start, test_end)] for train_start, test_start, test_end in folds
+        )))
+        n_jobs = validate_n_jobs(n_jobs, len(windows))
+        metric_pos = self.metric_cols.index(metric)
+        dates = self.pivoted_data.index
+
+        progress_tracker = ProgressTracker(len(folds), progress or LogProgress(), metric, unit='fold')
+        progress_tracker.start()
+
+        window_results = zip(windows, self._run_windows(idx_matrices, windows, n_jobs))
+        window_metrics = {}
+
+        fold_results = []
+        for fold_num, (train_start, test_start, test_end) in enumerate(folds):
+            # Windows arrive in fold order, so a fold is reported as soon as both are done
+            while (train_start, test_start) not in window_metrics or (test_start, test_end) not in window_metrics:
+                window, metrics_array = next(window_results)
+                window_metrics[window] = metrics_array
+            
+            # Best option on the training window, undefined scores rank last
+            train_metrics = window_metrics[(train_start, test_start)]
+            scores = np.nan_to_num(train_metrics[:, metric_pos], nan=-np.inf)
+            option_num = int(np.argmax(scores))
+            test_metrics = window_metrics[(test_start, test_end)][option_num]
+
+            fold_results.append(
+                [dates[train_start], dates[test_start - 1], dates[test_start], dates[test_end - 1], option_num, train_metrics[option_num, metric_pos]] +
+                list(test_metrics) + self._get_option_params(idx_matrices[option_num])
+            )
+            progress_tracker.update(fold_num, dict(zip(self.metric_cols, test_metrics)))
+        
+        # Consolidate walk-forward report
+        fold_cols = ['train_start', 'train_end', 'test_start', 'test_end', 'option', f'train_{metric}']
+        walk_forward_results = pd.DataFrame(fold_results, columns=fold_cols + self.metric_cols + self.param_cols)
+        walk_forward_results[['max_drawdown_days', 'trade_count']] = walk_forward_results[['max_drawdown_days', 'trade_count']].astype(np.int64)
+        walk_forward_results.index.name = 'fold'
+        self.walk_forward_results = walk_forward_results
+
+        # Test metrics averaged over folds, returns and trades chained
+        summary = walk_forward_results[self.metric_cols].mean()
+        summary['cumm_return'] = walk_forward_results['cumm_return'].prod()
+        summary['max_drawdown_days'] = walk_forward_results['max_drawdown_days'].max()
+        summary['trade_count'] = walk_forward_results['trade_count'].sum()
+        self.walk_forward_summary = summary
+
+        return self.walk_forward_results
+    
+
+    def _get_walk_forward_folds(self, train_years, expanding):
+        # Date index boundaries of every calendar year
+        years = self.pivoted_data.index.year
+        year_bounds = list(np.flatnonzero(np.r_[True, years[1:] != years[:-1]])) + [len(years)]
+
+        folds = []
+        for year_num in range(train_years, len(year_bounds) - 1):
+            train_start = year_bounds[0] if expanding else year_bounds[year_num - train_years]
+            folds.append((train_start, year_bounds[year_num], year_bounds[year_num + 1]))
+        
+        return folds
+    
+
+    def _run_windows(self, idx_matrices, windows, n_jobs):
+        # Window metrics are yielded in order, as they are done
+        if n_jobs == 1:
+            return (self._run_window(idx_matrices, window) for window in windows)
+        
+        return self._map_shared(_run_shared_window, n_jobs, itertools.repeat(idx_matrices), windows)
+    
+
+    def _run_window(self, idx_matrices, window):
+        start_idx, end_idx = window
+        option_results = self._run_options(idx_matrices, end_idx, start_idx)
+
+        return np.array([consolidated_results for consolidated_results, _ in option_results], dtype=np.float64)
+    
+
+    def robustness(
+        self,
+        option_num,
+        method='start_dates',
+        n_sims=1000,
+        min_dates=252,
+        block_size=20,
+        seed=None,
+        n_jobs=1,
+        progress=None,
+        progress_metric='sharpe_ratio'
+    ):
+        """
+        Distribution of an option's metrics under perturbed simulations.
+
+        option_num is the option's position in backtest_results. Methods:
+        - 'start_dates': the option is re-run from random start dates, with
+          at least `min_dates` dates left until the end of the data.
+        - 'bootstrap': the option's daily portfolio returns are resampled in
+          blocks of `block_size` dates; only return metrics are reported.
+        - 'tie_breaking': the option is re-run with equally ranked
+          candidates filling the slots left in a random order, where the
+          average rank rule would drop the whole tie group (NumPy engine
+          only). Simulations are stepped in lockstep batches of
+          `batch_size`.
+        Returns one row of metrics per simulation. Progress events count
+        simulations and go to the `progress` callback, as in run().
+        """
+        methods = ['start_dates', 'bootstrap', 'tie_breaking']
+        if method not in methods:
+            msg1 = f'Method {method} is not recognized.'
+            msg2 = f'Available methods: {", ".join(methods)}.'
+            raise ValueError(' '.join([msg1, msg2]))
+        
+        if method == 'tie_breaking' and self.engine != 'numpy':
+            raise ValueError('Method tie_breaking requires the numpy engine')
+        
+        idx_matrices = self._get_index_matrices()
+        if not 0 <= option_num < len(idx_matrices):
+            raise ValueError(f'Argument option_num must be between 0 and {len(idx_matrices) - 1}')
+        
+        idx_matrix = idx_matrices[option_num]
+        seed_sequence = np.random.SeedSequence(seed)
+        rng = np.random.default_rng(seed_sequence)
+
+        progress_metric = self._validate_metric(progress_metric)
+        progress_tracker = ProgressTracker(n_sims, progress or LogProgress(), progress_metric, unit='simulation')
+        progress_tracker.start()
+
+        if method == 'start_dates':
+            robustness_results = self._get_start_date_results(idx_matrix, n_sims, min_dates, rng, n_jobs, progress_tracker)
+        elif method == 'bootstrap':
+            robustness_results = self._get_bootstrap_results(idx_matrix, n_sims, block_size, rng, progress_tracker)
+        else:
+            robustness_results = self._get_tie_breaking_results(idx_matrix, n_sims, seed_sequence, n_jobs, progress_tracker)
+        
+        robustness_results.index.name = 'sim'
+        self.robustness_results = robustness_results
+
+        return self.robustness_results
+    
+
+    def _get_start_date_results(self, idx_matrix, n_sims, min_dates, rng, n_jobs, progress_tracker):
+        # Random start dates, each simulated once and shared by repeated draws
+        df_len = len(self.pivoted_data)
+        last_start = df_len - self.min_holding_days - min_dates
+        if last_start < 0:
+            raise ValueError(f'Data must have more than {self.min_holding_days + min_dates} dates for start_dates simulations')
+        
+        start_idxs = rng.integers(0, last_start + 1, n_sims)
+        windows = [(start_idx, df_len) for start_idx in np.unique(start_idxs)]
+        n_jobs = validate_n_jobs(n_jobs, len(windows))
+        window_metrics = {}
+        for window, metrics_array in zip(windows, self._run_windows([idx_matrix], windows, n_jobs)):
+            window_metrics[window] = metrics_array
+            self._report_simulations(progress_tracker, np.flatnonzero(start_idxs == window[0]), metrics_array[[0]], self.metric_cols)
+
+        robustness_results = pd.DataFrame([window_metrics[(start_idx, df_len)][0] for start_idx in start_idxs], columns=self.metric_cols)
+        robustness_results[['max_drawdown_days', 'trade_count']] = robustness_results[['max_drawdown_days', 'trade_count']].astype(np.int64)
+        robustness_results.insert(0, 'start_date', self.pivoted_data.index[start_idxs])
+
+        return robustness_results
+    
+
+    def _get_bootstrap_results(self, idx_matrix, n_sims, block_size, rng, progress_tracker):
+        trade_ledger = self._run_option_ledger(idx_matrix)
+        portfolio_size = self.portfolio_size[idx_matrix[-2]]
+        returns = self._get_daily_returns(trade_ledger, portfolio_size)[1][self.min_holding_days:]
+
+        # Circular blocks of consecutive dates, cut to the original length
+        blocks_count = int(np.ceil(len(returns) / block_size))
+        block_starts = rng.integers(0, len(returns), (n_sims, blocks_count))
+        date_idx = (block_starts[:, :, None] + np.arange(block_size)).reshape(n_sims, -1)[:, :len(returns)]
+        return_metrics = metrics.get_return_metrics(returns[date_idx % len(returns)])
+
+        robustness_results = pd.DataFrame(return_metrics)
+        self._report_simulations(progress_tracker, np.arange(n_sims), robustness_results.to_numpy(dtype=np.float64), robustness_results.columns)
+        robustness_results['max_drawdown_days'] = robustness_results['max_drawdown_days'].astype(np.int64)
+
+        return robustness_results
+    
+
+    def _get_tie_breaking_results(self, idx_matrix, n_sims, seed_sequence, n_jobs, progress_tracker):
+        # Lockstep batches of the same option, each with its own random stream
+        batch_sizes = [len(batch) for batch in np.array_split(np.arange(n_sims), int(np.ceil(n_sims / self.batch_size)))]
+        batch_seeds = seed_sequence.spawn(len(batch_sizes))
+        n_jobs = validate_n_jobs(n_jobs, len(batch_sizes))
+
+        if n_jobs > 1:
+            batch_results = self._map_shared(_run_shared_tie_breaking, n_jobs, itertools.repeat(idx_matrix), batch_sizes, batch_seeds)
+        else:
+            batch_results = map(self._run_tie_breaking, itertools.repeat(idx_matrix), batch_sizes, batch_seeds)
+        
+        sim_metrics = []
+        for batch_start, batch_metrics in zip(np.cumsum([0] + batch_sizes), batch_results):
+            self._report_simulations(progress_tracker, batch_start + np.arange(len(batch_metrics)), batch_metrics, self.metric_cols)
+            sim_metrics.append(batch_metrics)
+        
+        robustness_results = pd.DataFrame(np.concatenate(sim_metrics), columns=self.metric_cols)
+        robustness_results[['max_drawdown_days', 'trade_count']] = robustness_results[['max_drawdown_days', 'trade_count']].astype(np.int64)
+
+        return robustness_results
+    
+
+    def _report_simulations(self, progress_tracker, sim_nums, sim_metrics, metric_cols):
+        # One progress event per simulation, rows of sim_metrics broadcast over sim_nums
+        sim_metrics = np.broadcast_to(sim_metrics, (len(sim_nums), len(metric_cols)))
+        for sim_num, metrics_row in zip(sim_nums, sim_metrics):
+            progress_tracker.update(int(sim_num), dict(zip(metric_cols, metrics_row)))
+        
+        return self
+    
+
+    def _run_tie_breaking(self, idx_matrix, sims_count, seed):
+        self.tie_breaker = np.random.default_rng(seed)
+        try:
+            option_results = self._run_batch([idx_matrix] * sims_count)
+        finally:
+            self.tie_breaker = None
+        
+        return np.array([consolidated_results for consolidated_results, _ in option_results], dtype=np.float64)
+    
+
+    def _run_option_ledger(self, idx_matrix, end_idx=None, start_idx=None):
+        if self.engine == 'numpy':
+            return self._simulate_arrays(idx_matrix, end_idx, start_idx)
+        
+        trading_logs = self._simulate(idx_matrix, end_idx, start_idx)
+        with self.profiler.phase('ledgers'):
+            return TradeLedger.from_dense(trading_logs)
+    
+
+    def _get_shard_options(self, options_count, shard):
+        if shard is None:
+            return list(range(options_count))
+        
+        # Round robin, so every shard gets a similar mix of the ordered grid
+        shard_num, shards_count = self._validate_shard(shard)
+        
+        return list(range(shard_num, options_count, shards_count))
+    
+
+    def _run_pool(self, idx_matrices, n_jobs, end_idx=None, start_idx=None, states=None):
+        # Deterministic shards, several per worker to balance uneven options
+        shards_count = min(len(idx_matrices), n_jobs * 4)
+        shards = [list(shard) for shard in np.array_split(np.arange(len(idx_matrices)), shards_count)]
+        matrix_shards = [[idx_matrices[i] for i in shard] for shard in shards]
+
+        # Search stages send the options' states along and get them back updated
+        if states is None:
+            pool_results = self._map_shared(_run_shared_options, n_jobs, matrix_shards, itertools.repeat(end_idx), itertools.repeat(start_idx))
+        else:
+            state_shards = [[states[i] for i in shard] for shard in shards]
+            pool_results = self._map_shared(_run_shared_stage, n_jobs, matrix_shards, itertools.repeat(end_idx), state_shards)
+        
+        for shard_results, shard_timings in pool_results:
+            self.profiler.merge(shard_timings)
+            yield from shard_results
+    
+
+    def _map_shared(self, func, n_jobs, *iterables):
+        # Workers read the pivoted panel from the shared Backtest instance
+        return map_shared(func, self, n_jobs, *iterables)
+    
+
+    def _run_options(self, idx_matrices, end_idx=None, start_idx=None):
+        if self.engine == 'numpy' and self.batch_size > 1:
+            for start in range(0, len(idx_matrices), self.batch_size):
+                yield from self._run_batch(idx_matrices[start:start + self.batch_size], end_idx, start_idx)
+        else:
+            for idx_matrix in idx_matrices:
+                yield self._run_option(idx_matrix, end_idx, start_idx)
+    
+
+    def _run_batch(self, idx_matrices, end_idx=None, start_idx=None, state=None):
+        trade_ledgers = self._simulate_batch(idx_matrices, end_idx, start_idx, state)
+        with self.profiler.phase('evaluation'):
+            batch_results = self._evaluate_ledgers(trade_ledgers, idx_matrices, end_idx, start_idx)
+        
+        option_results = []
+        for trade_ledger, consolidated_results in zip(trade_ledgers, batch_results):
+            option_results.append((consolidated_results, trade_ledger if self.keep_ledgers else None))
+        
+        return option_results
+    
+
+    def _run_option(self, idx_matrix, end_idx=None, start_idx=None):
+        trade_ledger = self._run_option_ledger(idx_matrix, end_idx, start_idx)
+        with self.profiler.phase('evaluation'):
+            consolidated_results = self._evaluate_ledgers([trade_ledger], [idx_matrix], end_idx, start_idx)[0]
+
+        return consolidated_results, trade_ledger if self.keep_ledgers else None
+    
+
+    def _construct_signal_masks(self):
+        # Panel-wide masks only depend on (strategy, threshold), not on the option
+        self.signal_masks = {}
+        for predicate in self.buy_predicates + self.sell_predicates:
+            if predicate.is_stateful:
+                continue
+            
+            for threshold_idx, _ in enumerate(predicate.thresholds):
+                signal_key = predicate.get_key(threshold_idx)
+                if signal_key in self.signal_masks:
+                    continue
+                
+                mask = predicate.evaluate(self.arrays, threshold_idx)
+                if self.pack_signals:
+                    mask = np.packbits(mask, axis=1)
+                
+                self.signal_masks[signal_key] = mask
         
-        symbols = self.data.index.get_level_values(self.symbol_col).unique()
+        return self
+    
+
+    def _bind_phases(self):
+        # Per-date phase contexts, bound once before the date loop so a disabled
+        # profiler only costs entering a no-op context
+        return (
+            self.profiler.phase('state'),
+            [self.profiler.phase('signals', predicate.type) for predicate in self.buy_predicates],
+            [self.profiler.phase('signals', predicate.type) for predicate in self.sell_predicates],
+            self.profiler.phase('new_trades'),
+            self.profiler.phase('positions'),
+        )
+    
+
+    def _simulate(self, idx_matrix, end_idx=None, start_idx=None):
+        symbols = self.symbols
         symbols_len = len(symbols)
         df_shape = self.pivoted_data[self.price_col].shape
         df_index = self.pivoted_data.index
         df_len = len(self.pivoted_data)
-        idx_matrices = self._get_index_matrices()
+
+        trading_logs = pd.DataFrame(data=np.zeros(df_shape), columns=symbols, index=df_index, dtype=np.int8)
+        holding_days = pd.Series(data=np.zeros(symbols_len), index=symbols, dtype=np.int8)
+        trailing_pnl = pd.Series(data=np.ones(symbols_len), index=symbols, dtype=np.int8)
         
-        print(f'There are total {len(idx_matrices)} options')
+        # Trading slots
+        # portfolio_size = self.portfolio_size[idx_matrix[-2]]
+        # low_risk_prop = self.low_risk_prop[idx_matrix[-1]]
+        # low_risk_slots = round(portfolio_size * low_risk_prop)
+        # high_risk_slots = portfolio_size - low_risk_slots
 
-        for option_num, idx_matrix in enumerate(idx_matrices):
-            trading_logs = pd.DataFrame(data=np.zeros(df_shape), columns=symbols, index=df_index, dtype=np.int8)
-            holding_days = pd.Series(data=np.zeros(symbols_len), index=symbols, dtype=np.int8)
-            trailing_pnl = pd.Series(data=np.ones(symbols_len), index=symbols, dtype=np.int8)
-            
-            # Trading slots
-            # portfolio_size = self.portfolio_size[idx_matrix[-2]]
-            # low_risk_prop = self.low_risk_prop[idx_matrix[-1]]
-            # low_risk_slots = round(portfolio_size * low_risk_prop)
-            # high_risk_slots = portfolio_size - low_risk_slots
+        state_phase, buy_phases, sell_phases, new_trades_phase, positions_phase = self._bind_phases()
 
-            for date_idx in range(self.min_holding_days, df_len):
-                # Initiate empty signals
-                buy_signals = pd.Series(data=np.ones(symbols_len), index=symbols, dtype=np.int8)
-                sell_signals = pd.Series(data=np.zeros(symbols_len), index=symbols, dtype=np.int8)
+        for date_idx in range((start_idx or 0) + self.min_holding_days, end_idx or df_len):
+            # Initiate empty signals
+            buy_signals = pd.Series(data=np.ones(symbols_len), index=symbols, dtype=np.int8)
+            sell_signals = pd.Series(data=np.zeros(symbols_len), index=symbols, dtype=np.int8)
 
+            with state_phase:
                 # Get current positions and daily return
                 current_positions = trading_logs.iloc[date_idx-1]
                 daily_ret = (self.pivoted_data.iloc[date_idx-1][self.daily_ret_col] * (current_positions > 0)) + 1
@@ -170,68 +1173,264 @@ class Backtest():
                 trailing_pnl = (trailing_pnl * (current_positions > 0)).replace(0, 1)
                 trailing_pnl *= daily_ret
 
-                # Break line seperating buy and sell strategies
-                break_line = len(self.buy_strats)
-                
-                # Buy signals
-                for strat, option_idx in zip(self.buy_strats, idx_matrix[:break_line]):
-                    signal = self._generate_signals(strat, option_idx, date_idx)
+            # Break line seperating buy and sell strategies
+            break_line = len(self.buy_strats)
+            
+            # Buy signals
+            for predicate, option_idx, signal_phase in zip(self.buy_predicates, idx_matrix[:break_line], buy_phases):
+                with signal_phase:
+                    signal = self._generate_signals(predicate, option_idx, date_idx)
                     buy_signals *= signal
-                
-                # Sell signals
-                for strat, option_idx in zip(self.sell_strats, idx_matrix[break_line:-2]):
-                    if strat['type'] == 'holding_days':
-                        signal = self._generate_signals(strat, option_idx, None, holding_days)
-                    elif strat['type'] == 'trailing_stoploss':
-                        signal = self._generate_signals(strat, option_idx, None, trailing_pnl)
+            
+            # Sell signals
+            for predicate, option_idx, signal_phase in zip(self.sell_predicates, idx_matrix[break_line:-2], sell_phases):
+                with signal_phase:
+                    if predicate.type == 'holding_days':
+                        signal = self._generate_signals(predicate, option_idx, None, holding_days)
+                    elif predicate.type == 'trailing_stoploss':
+                        signal = self._generate_signals(predicate, option_idx, None, trailing_pnl)
                     else:
-                        signal = self._generate_signals(strat, option_idx, date_idx)
+                        signal = self._generate_signals(predicate, option_idx, date_idx)
                     
                     sell_signals = ((sell_signals + signal) > 0) * 1
                     sell_signals *= (holding_days >= self.min_holding_days)
-                
-                # Finalize new trades
+            
+            # Finalize new trades
+            with new_trades_phase:
                 new_trades = self._get_new_trades(current_positions, buy_signals, sell_signals, idx_matrix, date_idx)
-                
+            
+            with positions_phase:
                 trading_logs.iloc[date_idx] = (current_positions * (sell_signals == 0)) + new_trades
 
-            # Consolidate with all backtest results
-            self._consolidate_returns(trading_logs, idx_matrix)
+        return trading_logs
+    
+
+    def _simulate_arrays(self, idx_matrix, end_idx=None, start_idx=None):
+        symbols_len = len(self.symbols)
+        df_len = len(self.pivoted_data)
+        end_idx = end_idx or df_len
+        daily_rets = self.arrays[self.daily_ret_col]
+
+        # Only the latest positions are kept, position changes go to the ledger
+        current_positions = np.zeros(symbols_len, dtype=np.int8)
+        ledger_recorder = LedgerRecorder(current_positions.shape)
+        holding_days = np.zeros(symbols_len, dtype=np.int64)
+        trailing_pnl = np.ones(symbols_len, dtype=np.float64)
+
+        # Break line seperating buy and sell strategies
+        break_line = len(self.buy_strats)
+
+        state_phase, buy_phases, sell_phases, new_trades_phase, positions_phase = self._bind_phases()
+
+        for date_idx in range((start_idx or 0) + self.min_holding_days, end_idx):
+            with state_phase:
+                # Get daily return of current positions
+                is_held = current_positions > 0
+                daily_ret = (daily_rets[date_idx-1] * is_held) + 1
+
+                # Get holding days
+                holding_days += is_held
+                holding_days *= is_held
+
+                # Get trailing P&L
+                trailing_pnl = trailing_pnl * is_held
+                trailing_pnl[trailing_pnl == 0] = 1
+                trailing_pnl *= daily_ret
+
+            # Buy signals
+            buy_signals = np.ones(symbols_len, dtype=np.float64)
+            for predicate, option_idx, signal_phase in zip(self.buy_predicates, idx_matrix[:break_line], buy_phases):
+                with signal_phase:
+                    buy_signals *= self._generate_array_signals(predicate, option_idx, date_idx)
+            
+            # Sell signals
+            sell_signals = np.zeros(symbols_len, dtype=bool)
+            for predicate, option_idx, signal_phase in zip(self.sell_predicates, idx_matrix[break_line:-2], sell_phases):
+                with signal_phase:
+                    if predicate.type == 'holding_days':
+                        sell_signals |= self._generate_array_signals(predicate, option_idx, None, holding_days)
+                    elif predicate.type == 'trailing_stoploss':
+                        sell_signals |= self._generate_array_signals(predicate, option_idx, None, trailing_pnl)
+                    else:
+                        sell_signals |= self._generate_array_signals(predicate, option_idx, date_idx)
             
-            # Display new result
-            trade_count = self.backtest_results.iloc[-1]['trade_count']
-            cumm_return = round(self.backtest_results.iloc[-1]['cumm_return'], 2)
-            sharpe_ratio = round(self.backtest_results.iloc[-1]['sharpe_ratio'], 2)
-            print(f'Option {option_num + 1} - ', end='')
-            print(f'Trade count: {trade_count} - Cumm Ret: {cumm_return} - Sharpe: {sharpe_ratio}')
+            sell_signals &= (holding_days >= self.min_holding_days)
+
+            # Finalize new trades
+            with new_trades_phase:
+                new_trades = self._get_array_new_trades(current_positions, buy_signals, sell_signals, idx_matrix, date_idx)
+
+            with positions_phase:
+                new_positions = ((current_positions * ~sell_signals) + new_trades).astype(np.int8)
+                ledger_recorder.update(date_idx, current_positions, new_positions)
+                current_positions = new_positions
         
-        return self.backtest_results
+        with self.profiler.phase('ledgers'):
+            ledger_recorder.close(end_idx, current_positions)
+            return ledger_recorder.get_ledgers(self.pivoted_data.index, self.symbols)[0]
     
 
-    def _consolidate_returns(self, trading_logs, idx_matrix):
+    def _simulate_batch(self, idx_matrices, end_idx=None, start_idx=None, state=None):
+        # Options are stepped in lockstep as rows of option x symbol arrays, from the
+        # given state when there is one, which is then left at end_idx
+        idx_array = np.asarray(idx_matrices)
+        batch_len = len(idx_array)
+        symbols_len = len(self.symbols)
+        df_len = len(self.pivoted_data)
+        end_idx = end_idx or df_len
+        daily_rets = self.arrays[self.daily_ret_col]
+
+        # Only the latest positions are kept, position changes go to the ledgers
+        if state is None:
+            state = SimulationState.start((batch_len, symbols_len), (start_idx or 0) + self.min_holding_days)
+        current_positions = state.positions
+        ledger_recorder = state.ledger_recorder
+        holding_days = state.holding_days
+        trailing_pnl = state.trailing_pnl
+
+        # Break line seperating buy and sell strategies
+        break_line = len(self.buy_strats)
+
+        state_phase, buy_phases, sell_phases, new_trades_phase, positions_phase = self._bind_phases()
+
+        for date_idx in range(state.date_idx, end_idx):
+            with state_phase:
+                # Get daily return of current positions
+                is_held = current_positions > 0
+                daily_ret = (daily_rets[date_idx-1] * is_held) + 1
+
+                # Get holding days
+                holding_days += is_held
+                holding_days *= is_held
+
+                # Get trailing P&L
+                trailing_pnl = trailing_pnl * is_held
+                trailing_pnl[trailing_pnl == 0] = 1
+                trailing_pnl *= daily_ret
+
+            # Buy signals
+            buy_signals = np.ones((batch_len, symbols_len), dtype=np.float64)
+            for strat_num, (predicate, signal_phase) in enumerate(zip(self.buy_predicates, buy_phases)):
+                with signal_phase:
+                    buy_signals *= self._generate_batch_signals(predicate, idx_array[:, strat_num], date_idx)
+            
+            # Sell signals
+            sell_signals = np.zeros((batch_len, symbols_len), dtype=bool)
+            for strat_num, (predicate, signal_phase) in enumerate(zip(self.sell_predicates, sell_phases), break_line):
+                with signal_phase:
+                    if predicate.type == 'holding_days':
+                        sell_signals |= self._generate_batch_signals(predicate, idx_array[:, strat_num], None, holding_days)
+                    elif predicate.type == 'trailing_stoploss':
+                        sell_signals |= self._generate_batch_signals(predicate, idx_array[:, strat_num], None, trailing_pnl)
+                    else:
+                        sell_signals |= self._generate_batch_signals(predicate, idx_array[:, strat_num], date_idx)
+            
+            sell_signals &= (holding_days >= self.min_holding_days)
+
+            # Finalize new trades
+            with new_trades_phase:
+                new_trades = self._get_batch_new_trades(current_positions, buy_signals, sell_signals, idx_array, date_idx)
+
+            with positions_phase:
+                new_positions = ((current_positions * ~sell_signals) + new_trades).astype(np.int8)
+                ledger_recorder.update(date_idx, current_positions, new_positions)
+                current_positions = new_positions
+        
+        state.date_idx = end_idx
+        state.positions = current_positions
+        state.holding_days = holding_days
+        state.trailing_pnl = trailing_pnl
+
+        # Open positions are closed on a copy, the state keeps them open
+        with self.profiler.phase('ledgers'):
+            ledger_recorder = ledger_recorder.copy().close(end_idx, current_positions)
+            return ledger_recorder.get_ledgers(self.pivoted_data.index, self.symbols)
+    
+
+    def _evaluate_ledgers(self, trade_ledgers, idx_matrices, end_idx=None, start_idx=None):
+        # Metrics only cover the simulated date range
+        start_idx = start_idx or 0
+        end_idx = end_idx or len(self.pivoted_data)
+        df_len = end_idx - start_idx
+        options_count = len(trade_ledgers)
+        portfolio_sizes = np.array([self.portfolio_size[idx_matrix[-2]] for idx_matrix in idx_matrices])
+
+        # Daily portfolio returns and position counts, one row per option
+        returns = np.zeros((options_count, df_len))
+        holdings = np.zeros((options_count, df_len))
+        changes = np.zeros((options_count, df_len))
+        trade_counts = np.zeros(options_count, dtype=np.int64)
+        trade_results = []
+        for option_num, (trade_ledger, portfolio_size) in enumerate(zip(trade_ledgers, portfolio_sizes)):
+            date_idx, daily_returns = self._get_daily_returns(trade_ledger, portfolio_size)
+            returns[option_num] = daily_returns[start_idx:end_idx]
+            holdings[option_num] = np.bincount(date_idx, minlength=len(self.pivoted_data))[start_idx:end_idx]
+            exit_idx = trade_ledger.exit_idx[trade_ledger.exit_idx < end_idx]
+            changes[option_num] = np.bincount(trade_ledger.entry_idx - start_idx, minlength=df_len) + np.bincount(exit_idx - start_idx, minlength=df_len)
+            trade_counts[option_num] = len(date_idx)
+            trade_results.append(trade_ledger.get_trade_returns(self.daily_rets))
+
+        # Trades of every option, flattened
+        trade_returns = np.concatenate([trade_return for trade_return, _ in trade_results])
+        holding_days = np.concatenate([days for _, days in trade_results])
+        trade_option_idx = np.repeat(np.arange(options_count), [len(days) for _, days in trade_results])
+
+        # Calculate trading results
+        option_metrics = {'trade_count': trade_counts}
+        option_metrics.update(metrics.get_return_metrics(returns))
+        option_metrics.update(metrics.get_position_metrics(holdings, changes, portfolio_sizes))
+        option_metrics.update(metrics.get_trade_metrics(trade_option_idx, trade_returns, holding_days, options_count))
+
+        return [[option_metrics[col][option_num] for col in self.metric_cols] for option_num in range(options_count)]
+    
+
+    def _get_daily_returns(self, trade_ledger, portfolio_size):
+        # Daily returns of the held (date, symbol) cells only
+        date_idx, symbol_idx = trade_ledger.get_held_cells(self.symbols_order)
+        held_returns = self.daily_rets[date_idx, symbol_idx] * (1/portfolio_size)
+        held_returns[np.isnan(held_returns)] = 0
+
+        # Sum the dense rows of the held dates in pivoted column order, as the trading logs were summed
+        daily_returns = np.zeros(len(self.pivoted_data))
+        held_dates, row_idx = np.unique(date_idx, return_inverse=True)
+        chunk_len = max(DENSE_CHUNK_CELLS // len(self.symbols), 1)
+        for chunk_start in range(0, len(held_dates), chunk_len):
+            chunk_dates = held_dates[chunk_start:chunk_start + chunk_len]
+            cells = slice(*np.searchsorted(row_idx, [chunk_start, chunk_start + chunk_len]))
+            dense_returns = np.zeros((len(chunk_dates), len(self.symbols)))
+            dense_returns[row_idx[cells] - chunk_start, self.symbols_order[symbol_idx[cells]]] = held_returns[cells]
+            daily_returns[chunk_dates] = dense_returns.sum(axis=1)
+
+        return date_idx, daily_returns
+    
+
+    def _consolidate_returns(self, option_num, idx_matrix, consolidated_results):
+        self.result_sink.add(option_num, idx_matrix, consolidated_results)
+
+        return self
+    
+
+    def _get_option_params(self, idx_matrix):
         # Get strategies details
         break_line = len(self.buy_strats)
         buy_strats = [strat['threshold'][i] for strat, i in zip(self.buy_strats, idx_matrix[:break_line])]
         sell_strats = [strat['threshold'][i] for strat, i in zip(self.sell_strats, idx_matrix[break_line:-2])]
         portfolio_size = self.portfolio_size[idx_matrix[-2]]
         low_risk_prop = self.low_risk_prop[idx_matrix[-1]]
-        full_strats = [portfolio_size] + [low_risk_prop] + buy_strats + sell_strats
+        
+        return [portfolio_size] + [low_risk_prop] + buy_strats + sell_strats
+    
 
-        # Calculate trading results
-        trade_count = (trading_logs > 0).sum().sum()
-        sum_return = (self.pivoted_data[self.daily_ret_col] * (trading_logs > 0) * (1/portfolio_size)).sum(axis=1)
-        cumm_return = np.prod(sum_return + 1)
-        mean_return = np.mean(list(filter(lambda val: (val != 0), np.ravel(sum_return))))
-        std_return = np.std(list(filter(lambda val: (val != 0), np.ravel(sum_return))))
-        sharpe_ratio = mean_return/std_return
+    def _get_backtest_results(self, idx_matrices):
+        option_nums = self.result_sink.get_saved_options()
+        params = [self._get_option_params(idx_matrices[i]) for i in option_nums]
 
-        # Consolidate results
-        consolidated_results = [cumm_return] + [sharpe_ratio] + [trade_count] + full_strats
-        consolidated_results = pd.DataFrame([consolidated_results,], columns=self.backtest_results.columns)
-        
-        self.backtest_results = pd.concat([self.backtest_results, consolidated_results])
+        backtest_results = pd.DataFrame(self.result_sink.metrics[option_nums], columns=self.metric_cols, index=option_nums)
+        backtest_results[['max_drawdown_days', 'trade_count']] = backtest_results[['max_drawdown_days', 'trade_count']].astype(np.int64)
+        backtest_results[self.param_cols] = pd.DataFrame(params, columns=self.param_cols, index=option_nums)
+        backtest_results.index.name = 'option'
 
-        return self
+        return backtest_results
     
 
     def _get_new_trades(self, current_positions, buy_signals, sell_signals, idx_matrix, date_idx):
@@ -284,6 +1483,120 @@ class Backtest():
         return new_trades
     
 
+    def _get_array_new_trades(self, current_positions, buy_signals, sell_signals, idx_matrix, date_idx):
+        # Get predictions and volume data
+        pred_vals = self.arrays[self.pred_col][date_idx-2]
+        pred_vals = np.where(np.isnan(pred_vals), 0, pred_vals)
+        pred_proba = self.arrays[self.pred_proba_col][date_idx-2]
+        vol = self.arrays[self.vol_col][date_idx-2]
+
+        # Update positions with sell signals
+        updated_positions = current_positions * ~sell_signals
+        
+        # Get portfolio size and low risk proportion
+        portfolio_size = self.portfolio_size[idx_matrix[-2]]
+        low_risk_prop = self.low_risk_prop[idx_matrix[-1]]
+
+        if low_risk_prop is None:
+            # Get available slots
+            avail_slots = portfolio_size - np.count_nonzero(updated_positions > 0)
+
+            # Select top stocks by predictions probability, then by volume
+            stock_pred_proba = buy_signals * pred_proba
+            stock_vol = vol * self._select_top(stock_pred_proba, avail_slots)
+
+            # New trading signals
+            new_trades = self._select_top(stock_vol, avail_slots) * pred_vals
+
+        else:
+            # Get available low risk slots
+            low_risk_slots = round(portfolio_size * low_risk_prop)
+            high_risk_slots = portfolio_size - low_risk_slots
+            low_risk_avail = low_risk_slots - np.count_nonzero(updated_positions == 1)
+            high_risk_avail = high_risk_slots - np.count_nonzero(updated_positions == 2)
+            
+            # Selected stock's risk probability
+            low_risk_pred_proba = buy_signals * (pred_vals == 1) * pred_proba
+            high_risk_pred_proba = buy_signals * (pred_vals == 2) * pred_proba
+
+            # Select top stocks by predictions probability, then by volume
+            low_risk_vol = vol * self._select_top(low_risk_pred_proba, low_risk_avail)
+            high_risk_vol = vol * self._select_top(high_risk_pred_proba, high_risk_avail)
+
+            # New trading signals
+            low_risk_new_trades = self._select_top(low_risk_vol, low_risk_avail) * pred_vals
+            high_risk_new_trades = self._select_top(high_risk_vol, high_risk_avail) * pred_vals
+            new_trades = low_risk_new_trades + high_risk_new_trades
+        
+        return new_trades
+    
+
+    def _get_batch_new_trades(self, current_positions, buy_signals, sell_signals, idx_array, date_idx):
+        # Get predictions and volume data
+        pred_vals = self.arrays[self.pred_col][date_idx-2]
+        pred_vals = np.where(np.isnan(pred_vals), 0, pred_vals)
+        pred_proba = self.arrays[self.pred_proba_col][date_idx-2]
+        vol = self.arrays[self.vol_col][date_idx-2]
+
+        # Update positions with sell signals
+        updated_positions = current_positions * ~sell_signals
+        
+        # Get portfolio size and low risk proportion of every option
+        portfolio_size = [self.portfolio_size[i] for i in idx_array[:, -2]]
+        low_risk_prop = [self.low_risk_prop[i] for i in idx_array[:, -1]]
+        is_unsplit = np.array([prop is None for prop in low_risk_prop])
+        new_trades = np.zeros(buy_signals.shape, dtype=np.float64)
+
+        if is_unsplit.any():
+            rows = np.flatnonzero(is_unsplit)
+
+            # Get available slots
+            avail_slots = np.array([portfolio_size[k] for k in rows]) - np.count_nonzero(updated_positions[rows] > 0, axis=1)
+            avail_slots = avail_slots[:, None]
+
+            # Select top stocks by predictions probability, then by volume
+            stock_pred_proba = buy_signals[rows] * pred_proba
+            stock_vol = vol * self._select_top(stock_pred_proba, avail_slots)
+
+            # New trading signals
+            new_trades[rows] = self._select_top(stock_vol, avail_slots) * pred_vals
+
+        if not is_unsplit.all():
+            rows = np.flatnonzero(~is_unsplit)
+
+            # Get available low risk slots
+            low_risk_slots = np.array([round(portfolio_size[k] * low_risk_prop[k]) for k in rows])
+            high_risk_slots = np.array([portfolio_size[k] for k in rows]) - low_risk_slots
+            low_risk_avail = (low_risk_slots - np.count_nonzero(updated_positions[rows] == 1, axis=1))[:, None]
+            high_risk_avail = (high_risk_slots - np.count_nonzero(updated_positions[rows] == 2, axis=1))[:, None]
+            
+            # Selected stock's risk probability
+            low_risk_pred_proba = buy_signals[rows] * (pred_vals == 1) * pred_proba
+            high_risk_pred_proba = buy_signals[rows] * (pred_vals == 2) * pred_proba
+
+            # Select top stocks by predictions probability, then by volume
+            low_risk_vol = vol * self._select_top(low_risk_pred_proba, low_risk_avail)
+            high_risk_vol = vol * self._select_top(high_risk_pred_proba, high_risk_avail)
+
+            # New trading signals
+            low_risk_new_trades = self._select_top(low_risk_vol, low_risk_avail) * pred_vals
+            high_risk_new_trades = self._select_top(high_risk_vol, high_risk_avail) * pred_vals
+            new_trades[rows] = low_risk_new_trades + high_risk_new_trades
+        
+        return new_trades
+    
+
+    def _select_top(self, values, k):
+        if self.tie_breaker is None:
+            return top_k_mask(values, k)
+        
+        # The tie group at the k-th value fills the slots left in random order.
+        # Zero scores are symbols without a signal rather than ties, so they keep the average rank rule
+        mask = top_k_mask(values, k, self.tie_breaker.random(values.shape))
+        
+        return np.where(values != 0, mask, top_k_mask(values, k))
+    
+
     def _get_index_matrices(self):
         strats = self.buy_strats + self.sell_strats
         strats = list(itertools.product(*[range(len(strat['threshold'])) for strat in strats]))
@@ -293,50 +1606,143 @@ class Backtest():
         return strats
     
 
-    def _generate_signals(self, strat, threshold_idx, date_idx=None, value_array=None):
-        if strat['type'] == 'simple_compare':
-            val = self.pivoted_data.iloc[date_idx-2][strat['col']]
-            threshold = strat['threshold'][threshold_idx]
-            compare_result = self._compare(val, threshold, strat['operation'])
-        
-        elif strat['type'] == 'double_compare':
-            val1 = self.pivoted_data.iloc[date_idx-2][strat['col'][0]]
-            val2 = self.pivoted_data.iloc[date_idx-2][strat['col'][1]]
-            threshold1 = strat['threshold'][threshold_idx][0]
-            threshold2 = strat['threshold'][threshold_idx][1]
-            compare_result1 = self._compare(val1, threshold1, strat['operation'][0])
-            compare_result2 = self._compare(val2, threshold2, strat['operation'][1])
-            compare_result = compare_result1 | compare_result2
-        
-        elif strat['type'] == 'columns_compare':
-            val = self.pivoted_data.iloc[date_idx-2][strat['col']]
-            ref_col = strat['threshold'][threshold_idx]
-            threshold = self.pivoted_data.iloc[date_idx-2][ref_col]
-            compare_result = self._compare(val, threshold, strat['operation'])
-        
-        elif strat['type'] == 'holding_days':
-            threshold = strat['threshold'][threshold_idx]
-            compare_result = self._compare(value_array, threshold, strat['operation'])
-        
-        elif strat['type'] == 'trailing_stoploss':
-            threshold = 1/(1 - strat['threshold'][threshold_idx])
-            compare_result = self._compare(1/value_array, threshold, strat['operation'])
+    def _get_grid_fingerprint(self):
+        # Hash of the strategies and every grid value, so saved results are only reused
+        # by the same grid, not just one of the same shape
+        grid = {
+            'buy_strats': self.buy_strats,
+            'sell_strats': self.sell_strats,
+            'portfolio_size': self.portfolio_size,
+            'low_risk_prop': self.low_risk_prop,
+            'min_holding_days': self.min_holding_days,
+        }
+        grid = json.dumps(grid, sort_keys=True, default=_to_builtin)
+        
+        return hashlib.sha256(grid.encode('utf-8')).hexdigest()
+    
+
+    def _generate_signals(self, predicate, threshold_idx, date_idx=None, value_array=None):
+        if predicate.is_stateful:
+            compare_result = predicate.evaluate(value_array, threshold_idx)
+        else:
+            compare_result = predicate.evaluate(self.pivoted_data.iloc[date_idx-2], threshold_idx)
                 
         return compare_result * 1
     
 
-    def _compare(self, val, threshold, operation):
-        if operation == '>':
-            return val > threshold
-        elif operation == '>=':
-            return val >= threshold
-        elif operation == '<':
-            return val < threshold
-        elif operation == '<=':
-            return val <= threshold
-        elif operation == '==':
-            return val == threshold
-        elif operation == 'in':
-            return val.isin(threshold)
-        elif operation == 'not in':
-            return ~val.isin(threshold)
+    def _generate_array_signals(self, predicate, threshold_idx, date_idx=None, value_array=None):
+        if predicate.is_stateful:
+            return predicate.evaluate(value_array, threshold_idx)
+        
+        mask = self.signal_masks[predicate.get_key(threshold_idx)][date_idx-2]
+        if self.pack_signals:
+            mask = np.unpackbits(mask, count=len(self.symbols)).view(bool)
+        
+        return mask
+    
+
+    def _generate_batch_signals(self, predicate, threshold_idxs, date_idx=None, value_array=None):
+        if predicate.is_stateful:
+            return predicate.evaluate(value_array, threshold_idxs)
+        
+        # One mask row per distinct threshold, broadcast to the options using it
+        unique_idxs, option_pos = np.unique(threshold_idxs, return_inverse=True)
+        masks = np.stack([self._generate_array_signals(predicate, i, date_idx) for i in unique_idxs])
+        
+        return masks[option_pos]
+    
+
+    def _validate_metric(self, metric):
+        if metric not in self.metric_cols:
+            msg1 = f'Metric {metric} is not recognized.'
+            msg2 = f'Available metrics: {", ".join(self.metric_cols)}.'
+            raise ValueError(' '.join([msg1, msg2]))
+        
+        return metric
+    
+
+    def _validate_shard(self, shard):
+        shard_num, shards_count = shard
+        if shards_count < 1 or not 0 <= shard_num < shards_count:
+            msg1 = f'Shard {shard_num} of {shards_count} is not valid.'
+            msg2 = 'Shards are numbered from 0 to N - 1 for N shards.'
+            raise ValueError(' '.join([msg1, msg2]))
+        
+        return shard_num, shards_count
+    
+
+    def _validate_fields(self, fields, columns):
+        missing_fields = [field for field in fields if field not in columns]
+        if missing_fields:
+            msg1 = 'Columns required by the backtest are missing from the data.'
+            msg2 = f'Missing columns: {", ".join(missing_fields)}.'
+            raise ValueError(' '.join([msg1, msg2]))
+        
+        return fields
+    
+
+    def _validate_batch_size(self, batch_size):
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError('Argument batch_size must be a positive integer')
+        
+        return batch_size
+    
+
+    def _validate_engine(self, engine):
+        engines = ['pandas', 'numpy']
+        if engine not in engines:
+            msg1 = f'Engine {engine} is not recognized.'
+            msg2 = f'Available engines: {", ".join(engines)}.'
+            raise ValueError(' '.join([msg1, msg2]))
+        
+        return engine
+
+
+def _run_shared_options(idx_matrices, end_idx=None, start_idx=None):
+    # Workers profile their own shard, the parent merges the timings
+    backtest = get_shared()
+    backtest.profiler.reset()
+    option_results = list(backtest._run_options(idx_matrices, end_idx, start_idx))
+
+    return option_results, backtest.profiler.timings
+
+
+def _run_shared_stage(idx_matrices, end_idx, states):
+    backtest = get_shared()
+    backtest.profiler.reset()
+    stage_results = list(backtest._run_stage(idx_matrices, end_idx, states))
+
+    return stage_results, backtest.profiler.timings
+
+
+def _run_shared_window(idx_matrices, window):
+    return get_shared()._run_window(idx_matrices, window)
+
+
+def _run_shared_tie_breaking(idx_matrix, sims_count, seed):
+    return get_shared()._run_tie_breaking(idx_matrix, sims_count, seed)
+
+
+def _get_rolling_z_scores(spreads, lookback):
+    # Z-score of every date against the previous `lookback` dates, itself included,
+    # on centered spreads so the running sums of squares keep their precision
+    spreads = spreads - spreads.mean(axis=0)
+    sums = np.cumsum(np.vstack([np.zeros((1, spreads.shape[1])), spreads]), axis=0)
+    squares = np.cumsum(np.vstack([np.zeros((1, spreads.shape[1])), spreads ** 2]), axis=0)
+    means = (sums[lookback:] - sums[:-lookback]) / lookback
+    variances = (squares[lookback:] - squares[:-lookback]) / lookback - means ** 2
+
+    z_scores = np.full(spreads.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_scores[lookback - 1:] = (spreads[lookback - 1:] - means) / np.sqrt(np.maximum(variances, 0))
+    
+    return z_scores
+
+
+
+def _to_builtin(value):
+    # JSON fallback for numpy values in strategy grids
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    
+    return str(value)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+# Import standard libraries
+import argparse
+import json
+import platform
+import time
+import warnings
+from pathlib import Path
+
+# Import third-party libraries
+import pandas as pd
+import numpy as np
+
+# Import local module
+from quantfin.portfolio.backtest import Backtest
+
+
+# 5 x 2 x 5 x 2 = 100 options
+SWEEP_STRATS = {
+    'buy_strats': [
+        {'type': 'simple_compare', 'col': 'vol_avg_100', 'operation': '>=', 'threshold': [10000, 30000, 50000, 100000, 200000]},
+        {'type': 'simple_compare', 'col': 'pred_val', 'operation': 'in', 'threshold': [[1, 2], [2]]},
+    ],
+    'sell_strats': [
+        {'type': 'simple_compare', 'col': 'pred_val', 'operation': '<', 'threshold': [0]},
+        {'type': 'holding_days', 'col': None, 'operation': '>=', 'threshold': [3, 5, 10, 20, 40]},
+        {'type': 'trailing_stoploss', 'col': None, 'operation': '>=', 'threshold': [0.02, 0.05]},
+    ],
+    'portfolio_size': [25],
+    'low_risk_prop': [0.25],
+}
+
+
+def make_synthetic_panel(n_symbols=500, n_years=5, seed=0, start_date='2010-01-01', listing_prop=0.3):
+    """
+    Synthetic (symbol, date) feature frame shaped like the backtest inputs.
+
+    Prices follow a geometric random walk with symbol-specific drift and
+    volatility, volumes are log-normal around a symbol-specific level and
+    predictions are noisy views of the next return, so that signals are
+    neither random nor perfect. A `listing_prop` share of the symbols is
+    listed late, which leaves the panel unbalanced like real universes.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start_date, periods=n_years * 252)
+    symbols = [f'SYM{i:04d}' for i in range(n_symbols)]
+    n_dates = len(dates)
+
+    # Prices
+    drifts = rng.normal(0.0003, 0.0005, n_symbols)
+    volatilities = rng.uniform(0.01, 0.04, n_symbols)
+    daily_rets = rng.normal(drifts, volatilities, (n_dates, n_symbols))
+    adj_close = rng.uniform(5, 100, n_symbols) * np.exp(np.cumsum(daily_rets, axis=0))
+
+    # Volumes and their 100-day average
+    vol_levels = np.exp(rng.normal(10, 1.5, n_symbols))
+    vol = np.round(vol_levels * np.exp(rng.normal(0, 0.5, (n_dates, n_symbols))))
+    vol_cumsum = np.cumsum(vol, axis=0)
+    vol_avg_100 = np.full(vol.shape, np.nan)
+    vol_avg_100[99:] = (vol_cumsum[99:] - np.vstack([np.zeros((1, n_symbols)), vol_cumsum[:-100]])) / 100
+
+    # Predictions of the next return, bucketed like the classifier outputs
+    next_rets = np.vstack([daily_rets[1:], np.zeros((1, n_symbols))])
+    scores = next_rets / volatilities + rng.normal(0, 1.5, (n_dates, n_symbols))
+    pred_val = np.select([scores < -1, scores < 0, scores < 1], [-2, -1, 1], 2).astype(np.float64)
+    up_proba = np.round(1 / (1 + np.exp(-scores)), 2)
+
+    # Late listings, with no volume history before the listing date
+    listing_idx = np.where(rng.random(n_symbols) < listing_prop, rng.integers(0, n_dates // 2, n_symbols), 0)
+    is_listed = np.arange(n_dates)[:, None] >= listing_idx
+    vol_avg_100[np.arange(n_dates)[:, None] < listing_idx + 99] = np.nan
+
+    date_idx, symbol_idx = np.nonzero(is_listed.T)[::-1]
+    index = pd.MultiIndex.from_arrays([np.asarray(symbols)[symbol_idx], dates[date_idx]], names=['symbol', 'date'])
+    fields = {'adj_close': adj_close, 'vol': vol, 'pred_val': pred_val, 'up_proba': up_proba, 'vol_avg_100': vol_avg_100}
+
+    return pd.DataFrame({field: values[date_idx, symbol_idx] for field, values in fields.items()}, index=index)
+
+
+def run_benchmark(n_symbols=500, n_years=5, engine='numpy', batch_size=1, n_jobs=1, seed=0, repeat=1):
+    """
+    Time the main Backtest phases on a synthetic panel.
+
+    Reports the best of `repeat` timings for the pivot, a single option and
+    a 100-option sweep, with sweep throughput in options and symbol-days
+    per second.
+    """
+    data = make_synthetic_panel(n_symbols, n_years, seed)
+    backtest = Backtest(data.copy(), engine=engine, batch_size=batch_size, **SWEEP_STRATS)
+    idx_matrices = backtest._get_index_matrices()
+    symbol_days = len(backtest.pivoted_data) * len(backtest.symbols)
+
+    def best_time(func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    pivot_time = best_time(backtest._construct_pivoted_df)
+    option_time = best_time(lambda: list(backtest._run_options(idx_matrices[:1])))
+    sweep_time = best_time(lambda: backtest.run(n_jobs=n_jobs, progress=_ignore_progress))
+
+    return {
+        'config': {
+            'n_symbols': n_symbols,
+            'n_years': n_years,
+            'engine': engine,
+            'batch_size': batch_size,
+            'n_jobs': n_jobs,
+            'seed': seed,
+            'options': len(idx_matrices),
+            'symbol_days': symbol_days,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+        },
+        'timings': {
+            'pivot_seconds': pivot_time,
+            'option_seconds': option_time,
+            'sweep_seconds': sweep_time,
+            'options_per_second': len(idx_matrices) / sweep_time,
+            'symbol_days_per_second': len(idx_matrices) * symbol_days / sweep_time,
+        },
+    }
+
+
+def save_baseline(result, path):
+    with open(path, 'w') as baseline_file:
+        json.dump(result, baseline_file, indent=2)
+
+    return path
+
+
+def compare_baseline(result, path, tolerance=0.1):
+    """
+    Compare benchmark timings with a saved baseline.
+
+    Speedup is baseline/current for durations and current/baseline for
+    throughputs, so above 1 is always faster. Changes beyond `tolerance`
+    are flagged as faster or slower.
+    """
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    comparison = pd.DataFrame({'baseline': baseline['timings'], 'current': result['timings']})
+    is_duration = comparison.index.str.endswith('_seconds')
+    comparison['speedup'] = np.where(is_duration, comparison['baseline'] / comparison['current'], comparison['current'] / comparison['baseline'])
+    comparison['status'] = np.select([comparison['speedup'] > 1 + tolerance, comparison['speedup'] < 1 - tolerance], ['faster', 'slower'], 'same')
+
+    mismatched = [key for key in ['n_symbols', 'n_years', 'engine', 'batch_size', 'n_jobs', 'seed'] if baseline['config'].get(key) != result['config'].get(key)]
+    if mismatched:
+        warnings.warn(f'Baseline was run with a different {", ".join(mismatched)}', stacklevel=2)
+
+    return comparison
+
+
+def _ignore_progress(event):
+    # Progress reporting is not part of the timed work
+    return
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark portfolio.backtest on a synthetic panel')
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--engine', default='numpy')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--save', help='Save the result as a baseline JSON file')
+    parser.add_argument('--compare', help='Compare the result with a baseline JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_args()
+    result = run_benchmark(args.symbols, args.years, args.engine, args.batch_size, args.n_jobs, args.seed, args.repeat)
+
+    print(pd.Series(result['config']).to_string())
+    print(pd.Series(result['timings']).to_string())
+
+    if args.compare and Path(args.compare).exists():
+        print(compare_baseline(result, args.compare, args.tolerance).to_string())
+
+    if args.save:
+        save_baseline(result, args.save)
@@ -8,6 +8,8 @@ import numpy as np
 from statsmodels.tsa.stattools import adfuller
 from statsmodels.tsa.stattools import coint
 from statsmodels.tsa.vector_ar.vecm import coint_johansen
+from statsmodels.tsa.adfvalues import mackinnoncrit
+from scipy.stats import norm
 
 # Sk-learn
 from sklearn.metrics import make_scorer, accuracy_score, f1_score, precision_score, recall_score, log_loss
@@ -16,6 +18,11 @@ from sklearn.metrics import make_scorer, accuracy_score, f1_score, precision_sco
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+# Local libraries
+from quantfin.portfolio._adfvalues import TAU_MAX, TAU_MIN, TAU_STAR, TAU_SMALL_P, TAU_LARGE_P
+from quantfin.portfolio._hurst import hurst_exponents
+from quantfin.portfolio._pool import map_shared, get_shared, validate_n_jobs
+
 sns.set(style='whitegrid')
 
 
@@ -31,6 +38,66 @@ def adf_test(series, alpha=0.05):
     except:
         return pass_test
 
+    return pass_test
+
+
+def adf_test_batch(matrix, alpha=0.05, maxlag=None, regression='c', autolag='AIC', chunk_size=100):
+    """
+    Augmented Dickey-Fuller test of every column of a dates x series matrix.
+
+    Matches adfuller(column, maxlag, regression, autolag) for equal-length
+    series without missing values, and returns one row per column with the
+    test statistic, p-value, used lag, number of observations, critical
+    values and whether the unit root is rejected at `alpha`. The lag search
+    regressions of a series are nested, so all of them come from a single
+    QR decomposition, and the final regressions are solved as stacks of
+    the series sharing the same lag. Series are processed `chunk_size`
+    columns at a time, which bounds the memory of the stacked regressions.
+    """
+    columns = matrix.columns if isinstance(matrix, pd.DataFrame) else None
+    values = np.asarray(matrix, dtype=np.float64)
+    values = values[:, None] if values.ndim == 1 else values
+    n_obs, n_series = values.shape
+
+    n_trend = len(regression) if regression != 'n' else 0
+    max_allowed = n_obs // 2 - n_trend - 1
+    if maxlag is None:
+        maxlag = min(max_allowed, int(np.ceil(12.0 * np.power(n_obs / 100.0, 1 / 4.0))))
+    if not 0 <= maxlag <= max_allowed:
+        msg1 = f'Lag {maxlag} is not valid for {n_obs} observations.'
+        msg2 = 'It must be between 0 and nobs/2 - 1 - ntrend.'
+        raise ValueError(' '.join([msg1, msg2]))
+
+    adf_stats = np.full(n_series, np.nan)
+    used_lags = np.zeros(n_series, dtype=np.int64)
+    ic_best = np.full(n_series, np.nan)
+    for start in range(0, n_series, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        adf_stats[chunk], used_lags[chunk], ic_best[chunk] = _get_adf_stats(values[:, chunk], maxlag, regression, autolag)
+
+    # Critical values only depend on the number of observations, i.e. on the lag
+    nobs = n_obs - 1 - used_lags
+    crit_values = np.full((n_series, 3), np.nan)
+    for lag in np.unique(used_lags):
+        crit_values[used_lags == lag] = mackinnoncrit(N=1, regression=regression, nobs=n_obs - 1 - lag)
+
+    is_constant = values.max(axis=0) == values.min(axis=0)
+    adf_stats[is_constant] = np.nan
+    p_values = _get_mackinnon_p_values(adf_stats, regression)
+    crit_col = ['1%', '5%', '10%'].index(''.join([str(int(alpha*100)), '%']))
+
+    return pd.DataFrame({
+        'adf_stat': adf_stats,
+        'p_value': p_values,
+        'used_lag': used_lags,
+        'nobs': nobs,
+        'ic_best': ic_best,
+        '1%': crit_values[:, 0],
+        '5%': crit_values[:, 1],
+        '10%': crit_values[:, 2],
+        'pass_test': adf_stats < crit_values[:, crit_col],
+    }, index=columns)
+
 
 def cadf_test(series1, series2, alpha=0.05):
 
@@ -61,24 +128,11 @@ def hurst_test(series, lags=20, benchmark=0.3):
 
     pass_test = False
 
-    # Create the range of lag values
-    lag_vector = range(2, lags)
-
-    # Calculate the array of the variances of the lagged differences
-    tau = [
-        np.sqrt(
-            np.std(np.subtract(series[lag:], series[:-lag]))
-        ) for lag in lag_vector
-    ]
-
-    # Use a linear fit to estimate the Hurst Exponent
-    poly = np.polyfit(np.log(lag_vector), np.log(tau), 1)
-    hurst = poly[0] * 2
+    hurst = hurst_exponents(np.asarray(series, dtype=np.float64)[None, :], lags)[0]
 
     if hurst <= benchmark:
         pass_test = True
 
-    # Return the Hurst exponent from the np.polyfit output
     return pass_test
 
 
@@ -106,10 +160,64 @@ def johansen_test(matrix, det_order=0, lags=1, alpha=0.05):
     return pass_test, result.evec
 
 
+def johansen_test_batch(matrix, baskets, det_order=0, lags=1, alpha=0.05, n_jobs=1, chunk_size=100):
+    """
+    Johansen test of many baskets of columns of a dates x symbols matrix.
+
+    `baskets` are lists of column labels when `matrix` is a DataFrame, of
+    column positions otherwise. The decompositions run in chunks over
+    `n_jobs` worker processes. The spreads of every eigenvector of every
+    basket are then built with one matrix multiply, and their half-lives
+    are estimated together with half_life_batch(). Returns one row per
+    basket with the johansen_test() result, the eigenvectors (one per
+    column) and the half-life of each eigenvector's spread. Baskets
+    referencing columns missing from `matrix` raise a ValueError.
+    """
+    values = np.asarray(matrix, dtype=np.float64)
+    basket_idx = [_get_basket_idx(matrix, basket) for basket in baskets]
+
+    chunks = [basket_idx[start:start + chunk_size] for start in range(0, len(basket_idx), chunk_size)]
+    results = [result for chunk_results in _map_johansen(values, chunks, det_order, lags, alpha, n_jobs) for result in chunk_results]
+    if not results:
+        return pd.DataFrame(columns=['basket', 'pass_test', 'eigenvectors', 'half_lives'])
+
+    # Spreads of all eigenvectors: basket weights scattered into one symbols x spreads matrix
+    weights = np.zeros((values.shape[1], sum(len(idx) for idx in basket_idx)))
+    spread_num = 0
+    for idx, (_, eigenvectors) in zip(basket_idx, results):
+        weights[idx[:, None], np.arange(spread_num, spread_num + len(idx))] = eigenvectors
+        spread_num += len(idx)
+    half_lives = np.split(half_life_batch(values @ weights), np.cumsum([len(idx) for idx in basket_idx])[:-1])
+
+    return pd.DataFrame({
+        'basket': list(baskets),
+        'pass_test': [pass_test for pass_test, _ in results],
+        'eigenvectors': [eigenvectors for _, eigenvectors in results],
+        'half_lives': half_lives,
+    })
+
+
+def _get_basket_idx(matrix, basket):
+    # Missing labels and out of range positions would silently test other columns
+    if isinstance(matrix, pd.DataFrame):
+        basket_idx = matrix.columns.get_indexer(basket)
+        missing_cols = [col for col, idx in zip(basket, basket_idx) if idx < 0]
+    else:
+        basket_idx = np.asarray(basket, dtype=np.int64)
+        missing_cols = [idx for idx in basket_idx if not 0 <= idx < np.shape(matrix)[1]]
+
+    if missing_cols:
+        msg1 = f'Basket {list(basket)} references columns missing from the matrix.'
+        msg2 = f'Missing columns: {", ".join(map(str, missing_cols))}.'
+        raise ValueError(' '.join([msg1, msg2]))
+
+    return basket_idx
+
+
 def engle_granger_test(series1, series2, alpha=0.05):
 
     result = coint(series1, series2)
-    pass_test = result[1] >= alpha
+    pass_test = result[1] < alpha
 
     return pass_test
 
@@ -117,24 +225,30 @@ def engle_granger_test(series1, series2, alpha=0.05):
 def half_life_calc(matrix, eigenvector):
     
     yport = portfolio_val(matrix, eigenvector)
-    
-    deltaY = np.diff(yport)
-    
-    yy = np.vstack([yport[1:], np.ones(len(yport[1:]))]).T
-    
-    beta = np.linalg.lstsq(yy, deltaY)
-    
-    half_life = np.log(2)/beta[0]
 
-    return half_life[0]
+    return half_life_batch(yport[:, None])[0]
 
 
-def portfolio_val(matrix, eigenvector):
+def half_life_batch(spreads):
+    """
+    Mean-reversion half-life of every column of a dates x spreads array.
+
+    Each spread's changes are regressed on its lagged level with an
+    intercept, all columns at once with the closed-form least squares
+    slope, and the half-life is -log(2) / slope. Spreads that do not
+    revert get a negative or infinite half-life.
+    """
+    spreads = np.asarray(spreads, dtype=np.float64)
+    lagged = spreads[:-1] - spreads[:-1].mean(axis=0)
+    changes = np.diff(spreads, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = (lagged * (changes - changes.mean(axis=0))).sum(axis=0) / (lagged ** 2).sum(axis=0)
+        return -np.log(2) / slopes
 
-    temp = np.matlib.repmat(eigenvector, len(matrix), 1)
-    portfolio_val = np.sum(np.multiply(temp, matrix), 1)
 
-    return portfolio_val
+def portfolio_val(matrix, eigenvector):
+
+    return np.asarray(matrix) @ np.asarray(eigenvector)
 
 
 def visualize_validation(true_values, predictions, exp_ret, exp_ret_std, average='macro'):
@@ -171,6 +285,97 @@ def _plot_predictions(df):
     
     return
 
+
+def _get_adf_lags(values, diffs, maxlag, regression, autolag):
+    # Every candidate lag is fitted on the same observations, like adfuller
+    nobs = values.shape[0] - 1 - maxlag
+    design, target = _get_adf_design(values, diffs, maxlag, nobs, regression, level_last=False)
+    q, _ = np.linalg.qr(design)
+    projections = np.einsum('snk,sn->sk', q, target)
+    full_ssr = ((target - np.einsum('snk,sk->sn', q, projections)) ** 2).sum(axis=1)
+
+    # Nested regressions: dropping the last columns adds their projections back to the SSR
+    n_cols = np.arange(design.shape[2] - maxlag, design.shape[2] + 1)
+    dropped = np.cumsum(projections[:, ::-1] ** 2, axis=1)[:, ::-1]
+    ssr = full_ssr[:, None] + np.hstack([dropped[:, n_cols[:-1]], np.zeros((len(full_ssr), 1))])
+
+    with np.errstate(divide='ignore'):
+        llf = -nobs / 2 * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1)
+    if autolag == 'aic':
+        ic = -2 * llf + 2 * n_cols
+    elif autolag == 'bic':
+        ic = -2 * llf + np.log(nobs) * n_cols
+    else:
+        raise ValueError(f'Autolag method {autolag} is not recognized. Available methods: aic, bic.')
+
+    # Smallest criterion, the shortest lag among ties
+    best_lags = np.argmin(ic, axis=1)
+
+    return best_lags, ic[np.arange(len(best_lags)), best_lags]
+
+
+def _get_adf_stats(values, maxlag, regression, autolag):
+    n_obs, n_series = values.shape
+    diffs = np.diff(values, axis=0)
+    if autolag:
+        used_lags, ic_best = _get_adf_lags(values, diffs, maxlag, regression, autolag.lower())
+    else:
+        used_lags, ic_best = np.full(n_series, maxlag), np.full(n_series, np.nan)
+
+    # Final regressions, level last so its t-value comes straight from the QR
+    adf_stats = np.full(n_series, np.nan)
+    for lag in np.unique(used_lags):
+        series_idx = np.flatnonzero(used_lags == lag)
+        design, target = _get_adf_design(values[:, series_idx], diffs[:, series_idx], lag, n_obs - 1 - lag, regression, level_last=True)
+        q, r = np.linalg.qr(design)
+        projections = np.einsum('snk,sn->sk', q, target)
+        ssr = ((target - np.einsum('snk,sk->sn', q, projections)) ** 2).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sigma = np.sqrt(ssr / (design.shape[1] - design.shape[2]))
+            adf_stats[series_idx] = np.sign(r[:, -1, -1]) * projections[:, -1] / sigma
+
+    return adf_stats, used_lags, ic_best
+
+
+def _map_johansen(values, chunks, det_order, lags, alpha, n_jobs):
+    n_jobs = validate_n_jobs(n_jobs, len(chunks))
+    repeated_args = [[arg] * len(chunks) for arg in [det_order, lags, alpha]]
+
+    return map_shared(_run_johansen, values, n_jobs, chunks, *repeated_args)
+
+
+def _run_johansen(chunk, det_order, lags, alpha):
+    values = get_shared()
+
+    return [johansen_test(values[:, idx], det_order, lags, alpha) for idx in chunk]
+
+
+def _get_mackinnon_p_values(adf_stats, regression):
+    # Vectorized mackinnonp(adf_stat, regression, N=1)
+    small_p = np.polyval(TAU_SMALL_P[regression][::-1], adf_stats)
+    large_p = np.polyval(TAU_LARGE_P[regression][::-1], adf_stats)
+    p_values = norm.cdf(np.where(adf_stats <= TAU_STAR[regression], small_p, large_p))
+    p_values[adf_stats > TAU_MAX[regression]] = 1.0
+    p_values[adf_stats < TAU_MIN[regression]] = 0.0
+
+    return p_values
+
+
+def _get_adf_design(values, diffs, lag, nobs, regression, level_last):
+    # Series x observations x regressors: trend terms, lagged level and lagged differences
+    rows = np.arange(values.shape[0] - 1 - nobs, values.shape[0] - 1)
+    n_series = values.shape[1]
+    trend = np.arange(1, nobs + 1, dtype=np.float64)
+    n_trend = len(regression) if regression != 'n' else 0
+    trends = [np.broadcast_to((trend ** power)[None, :], (n_series, nobs)) for power in range(n_trend)]
+    lagged_diffs = [diffs[rows - i].T for i in range(1, lag + 1)]
+    level = values[rows].T
+
+    regressors = trends + lagged_diffs + [level] if level_last else trends + [level] + lagged_diffs
+    design = np.stack(regressors, axis=2)
+
+    return design, diffs[rows].T
+
 """
 https://docs.google.com/document/d/e/2PACX-1vRX3fSsFhhQLInqAD1swVCEdCTmDTk6p5gwOdN20KA4tvNBqr5PvF6OT6gQP790KxyRa9SIiwUSWwFP/pub?fbclid=IwAR0Ke142QCK9h_kW3QoHcXzzP_AR5rgv5D6t8aauYw8FTe2wonrJWUcps2M
 https://docs.google.com/document/d/e/2PACX-1vTTldxUdrsCKFDDqmLEO17c1wwnkLkNeb-XwiwXfvTKJpJZqIkzwAXUCMpA_x8ICIYEEm5so3ET929f/pub?fbclid=IwAR2phbhtcsI58xjsIMXcgawks4PKQndfAdg3lXSUeGq0hmxmdvAu3nh2Evo
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+# Import third-party libraries
+import numpy as np
+
+
+def get_return_metrics(returns):
+    """
+    Metrics of daily portfolio returns, one row per option.
+
+    `returns` is an options x dates matrix (a 1-d vector is a single
+    option). Ratios are computed over the active dates only, i.e. dates
+    with a non-zero return, and are not annualized. Max drawdown is the
+    largest loss from a running peak of the cumulative return, as a
+    positive fraction, and its duration is the longest number of dates
+    spent below a previous peak.
+    """
+    returns = np.atleast_2d(np.asarray(returns, dtype=np.float64))
+    is_active = returns != 0
+    active_count = np.count_nonzero(is_active, axis=1)
+
+    # Mean and deviation of each option's active returns, summed in the same order as the per-option backtest
+    mean_return = np.full(len(returns), np.nan)
+    std_return = np.full(len(returns), np.nan)
+    for option_num in np.flatnonzero(active_count):
+        active_returns = returns[option_num][is_active[option_num]]
+        mean_return[option_num] = np.mean(active_returns)
+        std_return[option_num] = np.std(active_returns)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        downside_std = np.sqrt((np.minimum(returns, 0) ** 2).sum(axis=1) / active_count)
+        sharpe_ratio = mean_return / std_return
+        sortino_ratio = mean_return / downside_std
+
+    # Drawdowns from the running peak of the cumulative return
+    cumm_returns = np.cumprod(returns + 1, axis=1)
+    peaks = np.maximum.accumulate(np.maximum(cumm_returns, 1), axis=1)
+    drawdowns = 1 - cumm_returns / peaks
+    max_drawdown = drawdowns.max(axis=1, initial=0)
+
+    # Dates since the last peak, restarting at every new peak
+    date_idx = np.arange(returns.shape[1])
+    last_peak_idx = np.maximum.accumulate(np.where(drawdowns > 0, -1, date_idx), axis=1)
+    max_drawdown_days = (date_idx - last_peak_idx).max(axis=1, initial=0)
+
+    return {
+        'cumm_return': np.prod(returns + 1, axis=1),
+        'sharpe_ratio': sharpe_ratio,
+        'sortino_ratio': sortino_ratio,
+        'max_drawdown': max_drawdown,
+        'max_drawdown_days': max_drawdown_days,
+    }
+
+
+def get_position_metrics(holdings, changes, portfolio_size):
+    """
+    Metrics of daily position counts, one row per option.
+
+    `holdings` is the number of positions held and `changes` the number of
+    positions opened or closed on each date, both options x dates.
+    Exposure is the average share of the portfolio slots in use and
+    turnover the average share of the slots traded per date, counting an
+    entry and an exit as half a turnover each.
+    """
+    holdings = np.atleast_2d(np.asarray(holdings, dtype=np.float64))
+    changes = np.atleast_2d(np.asarray(changes, dtype=np.float64))
+    portfolio_size = np.asarray(portfolio_size, dtype=np.float64).reshape(-1)
+
+    return {
+        'turnover': changes.mean(axis=1) / (2 * portfolio_size),
+        'exposure': holdings.mean(axis=1) / portfolio_size,
+    }
+
+
+def get_trade_metrics(option_idx, trade_returns, holding_days, options_count):
+    """
+    Metrics of closed and open trades, grouped by option.
+
+    Every trade belongs to the option at the same position of `option_idx`,
+    has a compounded return in `trade_returns` and lasts `holding_days`
+    dates. Hit rate is the share of trades with a positive return. Options
+    without trades get NaN.
+    """
+    option_idx = np.asarray(option_idx, dtype=np.int64)
+    trade_counts = np.bincount(option_idx, minlength=options_count)
+    hit_counts = np.bincount(option_idx, weights=np.asarray(trade_returns) > 0, minlength=options_count)
+    total_days = np.bincount(option_idx, weights=holding_days, minlength=options_count)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'hit_rate': hit_counts / trade_counts,
+            'avg_holding_days': total_days / trade_counts,
+        }
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+# Import standard libraries
+from pathlib import Path
+
+# Import third-party libraries
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from statsmodels.tsa.stattools import coint
+
+# Import local module
+from quantfin.portfolio._files import validate_format
+from quantfin.portfolio._pool import map_shared, get_shared, validate_n_jobs
+from quantfin.portfolio.evaluation import half_life_batch
+
+
+RESULT_FORMATS = ['.csv', '.parquet']
+RESULT_COLS = ['symbol1', 'symbol2', 'correlation', 'p_value', 'hedge_ratio', 'half_life']
+
+# Fixed Parquet schema, so chunks without any passing pair still match the others
+RESULT_SCHEMA = pa.schema([
+    ('symbol1', pa.string()),
+    ('symbol2', pa.string()),
+    ('correlation', pa.float64()),
+    ('p_value', pa.float64()),
+    ('hedge_ratio', pa.float64()),
+    ('half_life', pa.float64()),
+])
+
+
+def screen_pairs(
+    prices,
+    min_corr=0.8,
+    pairs=None,
+    groups=None,
+    liquidity=None,
+    min_liquidity=None,
+    alpha=0.05,
+    max_half_life=None,
+    results_path=None,
+    n_jobs=1,
+    chunk_size=500
+):
+    """
+    Screen every pair of a dates x symbols price frame for cointegration.
+
+    `pairs` optionally restricts the screen to a list of (symbol1, symbol2)
+    pairs, symbol1 being regressed on symbol2. Pairs are first pruned with
+    the correlation of log prices, computed for all symbols as one matrix
+    product. Only pairs with a correlation of at least `min_corr` are kept. When given, pairs must also share the same
+    `groups` label (e.g. sector), and both symbols need a `liquidity` of at
+    least `min_liquidity`. Both are Series indexed by symbol.
+
+    The Engle-Granger test then runs on the surviving pairs, in chunks
+    spread over `n_jobs` worker processes. Pairs with a p-value below
+    `alpha`, and a half-life up to `max_half_life` when given, are returned
+    with their OLS hedge ratio. They are also appended to `results_path`
+    (.csv or .parquet, with symbols stored as strings) chunk by chunk, in
+    order, as soon as each is tested.
+
+    Symbols with missing prices are not screened.
+    """
+    if results_path:
+        validate_format(Path(results_path), RESULT_FORMATS, 'Result')
+
+    prices = prices.loc[:, prices.notna().all()]
+    symbols = prices.columns
+    candidates = _get_candidates(prices, min_corr, pairs, groups, liquidity, min_liquidity)
+    chunks = [candidates[start:start + chunk_size] for start in range(0, len(candidates), chunk_size)]
+
+    writer = _ResultWriter(results_path)
+    screened = []
+    try:
+        for chunk_results in _map_chunks(prices.to_numpy(dtype=np.float64), chunks, alpha, max_half_life, n_jobs):
+            chunk_results = pd.DataFrame(chunk_results, columns=RESULT_COLS)
+            chunk_results['symbol1'] = symbols[chunk_results['symbol1'].to_numpy(dtype=np.int64)]
+            chunk_results['symbol2'] = symbols[chunk_results['symbol2'].to_numpy(dtype=np.int64)]
+            writer.write(chunk_results)
+            screened.append(chunk_results)
+    finally:
+        writer.close()
+
+    if not screened:
+        return pd.DataFrame(columns=RESULT_COLS)
+
+    return pd.concat(screened, ignore_index=True)
+
+
+def _get_candidates(prices, min_corr, pairs, groups, liquidity, min_liquidity):
+    # Correlation of log prices of all symbols in one matrix product
+    log_prices = np.log(prices.to_numpy(dtype=np.float64))
+    log_prices = log_prices - log_prices.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_prices = log_prices / np.sqrt((log_prices ** 2).sum(axis=0))
+    correlations = log_prices.T @ log_prices
+
+    # Pairs passing every prefilter
+    is_candidate = correlations >= min_corr
+    if groups is not None:
+        labels = groups.reindex(prices.columns).to_numpy()
+        is_candidate &= (labels[:, None] == labels[None, :]) & pd.notna(labels)[:, None]
+
+    if liquidity is not None and min_liquidity is not None:
+        is_liquid = (liquidity.reindex(prices.columns) >= min_liquidity).to_numpy()
+        is_candidate &= is_liquid[:, None] & is_liquid[None, :]
+
+    if pairs is None:
+        idx1, idx2 = np.nonzero(np.triu(is_candidate, k=1))
+    else:
+        idx1 = prices.columns.get_indexer([symbol1 for symbol1, _ in pairs])
+        idx2 = prices.columns.get_indexer([symbol2 for _, symbol2 in pairs])
+        is_valid = (idx1 >= 0) & (idx2 >= 0) & (idx1 != idx2)
+        is_valid[is_valid] &= is_candidate[idx1[is_valid], idx2[is_valid]]
+        idx1, idx2 = idx1[is_valid], idx2[is_valid]
+
+    return np.column_stack([idx1, idx2, correlations[idx1, idx2]])
+
+
+def _map_chunks(prices, chunks, alpha, max_half_life, n_jobs):
+    n_jobs = validate_n_jobs(n_jobs, len(chunks))
+
+    return map_shared(_test_pairs, prices, n_jobs, chunks, [alpha] * len(chunks), [max_half_life] * len(chunks))
+
+
+def _test_pairs(chunk, alpha, max_half_life):
+    prices = get_shared()
+    rows = []
+    for idx1, idx2, correlation in chunk:
+        series1 = prices[:, int(idx1)]
+        series2 = prices[:, int(idx2)]
+        p_value = coint(series1, series2)[1]
+        if not p_value < alpha:
+            continue
+
+        hedge_ratio, half_life = _get_spread_stats(series1, series2)
+        if max_half_life is not None and not 0 < half_life <= max_half_life:
+            continue
+
+        rows.append([idx1, idx2, correlation, p_value, hedge_ratio, half_life])
+
+    return rows
+
+
+def _get_spread_stats(series1, series2):
+    # OLS hedge ratio of series1 on series2, and the half-life of their spread
+    centered1 = series1 - series1.mean()
+    centered2 = series2 - series2.mean()
+    hedge_ratio = (centered1 @ centered2) / (centered2 @ centered2)
+
+    spread = series1 - hedge_ratio * series2
+
+    return hedge_ratio, half_life_batch(spread[:, None])[0]
+
+
+class _ResultWriter():
+    # Appends result chunks to a CSV or Parquet file as they arrive
+
+    def __init__(self, path):
+        self.path = Path(path) if path else None
+        self.parquet_writer = None
+        self.has_rows = False
+
+        if self.path and self.path.exists():
+            self.path.unlink()
+
+
+    def write(self, frame):
+        if not self.path:
+            return self
+
+        if self.path.suffix == '.csv':
+            frame.to_csv(self.path, mode='a', header=not self.has_rows, index=False)
+        else:
+            frame = frame.astype({'symbol1': str, 'symbol2': str})
+            table = pa.Table.from_pandas(frame, schema=RESULT_SCHEMA, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.path, RESULT_SCHEMA)
+            self.parquet_writer.write_table(table)
+
+        self.has_rows = True
+
+        return self
+
+
+    def close(self):
+        # Empty screens still leave a readable file
+        if self.path and not self.has_rows:
+            self.write(pd.DataFrame(columns=RESULT_COLS))
+
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+        return self
+
+
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+# Import standard libraries
+from pathlib import Path
+
+# Import third-party libraries
+import pandas as pd
+import numpy as np
+
+# Import local module
+from quantfin.portfolio._files import atomic_write, validate_format
+
+
+class SpreadTracker():
+    """
+    Incremental hedge ratio and spread z-score of many pairs.
+
+    Each pair regresses the price of its first symbol on the price of its
+    second symbol plus an intercept, with recursive least squares and an
+    exponential `forgetting` factor (1 weighs the whole history equally).
+    The spread p1 - hedge_ratio * p2 gets an exponentially weighted mean
+    and variance over `span` bars, from which the z-score is computed.
+
+    All pairs are updated at once in arrays, at O(1) cost per pair and
+    bar. Pairs with a missing price keep their state for that bar. The
+    z-score is NaN until a pair has seen `warmup` bars. The state can be
+    saved to and restored from a .npz checkpoint, as long as the symbols
+    are all strings or all integers.
+    """
+
+    def __init__(self, pairs, forgetting=0.99, span=20, warmup=20, delta=100.0):
+        self._validate_params(forgetting, span)
+
+        self.pairs = [tuple(pair) for pair in pairs]
+        self.forgetting = forgetting
+        self.span = span
+        self.warmup = warmup
+        self.delta = delta
+
+        n_pairs = len(self.pairs)
+        self.coefs = np.zeros((n_pairs, 2))
+        self.covs = np.tile(np.eye(2) * delta, (n_pairs, 1, 1))
+        self.spread = np.full(n_pairs, np.nan)
+        self.spread_mean = np.full(n_pairs, np.nan)
+        self.spread_var = np.full(n_pairs, np.nan)
+        self.z_score = np.full(n_pairs, np.nan)
+        self.n_obs = np.zeros(n_pairs, dtype=np.int64)
+
+
+    @property
+    def hedge_ratio(self):
+        return self.coefs[:, 0]
+
+
+    @property
+    def intercept(self):
+        return self.coefs[:, 1]
+
+
+    def update(self, prices1, prices2):
+        """
+        Add one bar of prices, as arrays aligned with `pairs`, and return
+        the z-scores.
+        """
+        prices1 = np.asarray(prices1, dtype=np.float64)
+        prices2 = np.asarray(prices2, dtype=np.float64)
+        is_valid = np.isfinite(prices1) & np.isfinite(prices2)
+        if not is_valid.all():
+            idx = np.flatnonzero(is_valid)
+            self._update_pairs(idx, prices1[idx], prices2[idx])
+        else:
+            self._update_pairs(slice(None), prices1, prices2)
+
+        return self.z_score
+
+
+    def update_prices(self, prices):
+        """
+        Add one bar from a Series of prices indexed by symbol.
+        """
+        symbols1, symbols2 = self._get_pair_symbols()
+        prices = pd.Series(prices, dtype=np.float64)
+
+        return self.update(prices.reindex(symbols1).to_numpy(), prices.reindex(symbols2).to_numpy())
+
+
+    def warm_up(self, prices):
+        """
+        Feed a dates x symbols price frame bar by bar, e.g. the history
+        before going live.
+        """
+        symbols1, symbols2 = self._get_pair_symbols()
+        prices1 = prices.reindex(columns=symbols1).to_numpy(dtype=np.float64)
+        prices2 = prices.reindex(columns=symbols2).to_numpy(dtype=np.float64)
+        for bar1, bar2 in zip(prices1, prices2):
+            self.update(bar1, bar2)
+
+        return self
+
+
+    def to_frame(self):
+        symbols1, symbols2 = self._get_pair_symbols()
+        frame = pd.DataFrame({
+            'symbol1': symbols1,
+            'symbol2': symbols2,
+            'hedge_ratio': self.hedge_ratio,
+            'intercept': self.intercept,
+            'spread': self.spread,
+            'spread_mean': self.spread_mean,
+            'spread_std': np.sqrt(self.spread_var),
+            'z_score': self.z_score,
+            'n_obs': self.n_obs,
+        })
+
+        return frame
+
+
+    def save(self, path):
+        path = validate_format(Path(path), ['.npz'], 'Checkpoint')
+        pairs = self._get_pairs_array()
+
+        with atomic_write(path) as file:
+            np.savez(
+                file,
+                pairs=pairs,
+                params=np.array([self.forgetting, self.span, self.warmup, self.delta]),
+                coefs=self.coefs,
+                covs=self.covs,
+                spread=self.spread,
+                spread_mean=self.spread_mean,
+                spread_var=self.spread_var,
+                z_score=self.z_score,
+                n_obs=self.n_obs,
+            )
+
+        return self
+
+
+    @classmethod
+    def load(cls, path):
+        path = validate_format(Path(path), ['.npz'], 'Checkpoint')
+
+        with np.load(path) as checkpoint:
+            forgetting, span, warmup, delta = checkpoint['params']
+            tracker = cls(
+                [tuple(pair.tolist()) for pair in checkpoint['pairs']],
+                forgetting=float(forgetting),
+                span=float(span),
+                warmup=int(warmup),
+                delta=float(delta)
+            )
+            for name in ['coefs', 'covs', 'spread', 'spread_mean', 'spread_var', 'z_score', 'n_obs']:
+                setattr(tracker, name, checkpoint[name].copy())
+
+        return tracker
+
+
+    def _update_pairs(self, idx, prices1, prices2):
+        coefs = self.coefs[idx]
+        covs = self.covs[idx]
+        regressors = np.column_stack([prices2, np.ones_like(prices2)])
+
+        # Recursive least squares step on the a priori error
+        errors = prices1 - (regressors * coefs).sum(axis=1)
+        cov_x = np.einsum('nij,nj->ni', covs, regressors)
+        gains = cov_x / (self.forgetting + (regressors * cov_x).sum(axis=1))[:, None]
+        coefs = coefs + gains * errors[:, None]
+        covs = (covs - gains[:, :, None] * cov_x[:, None, :]) / self.forgetting
+        covs = (covs + covs.transpose(0, 2, 1)) / 2
+
+        # Exponentially weighted mean and variance of the spread
+        spread = prices1 - coefs[:, 0] * prices2
+        n_obs = self.n_obs[idx] + 1
+        spread_mean = np.where(n_obs == 1, spread, self.spread_mean[idx])
+        spread_var = np.where(n_obs == 1, 0.0, self.spread_var[idx])
+        alpha = 2 / (self.span + 1)
+        deviation = spread - spread_mean
+        spread_mean = spread_mean + alpha * deviation
+        spread_var = (1 - alpha) * (spread_var + alpha * deviation ** 2)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_score = (spread - spread_mean) / np.sqrt(spread_var)
+        z_score = np.where(n_obs >= self.warmup, z_score, np.nan)
+
+        self.coefs[idx] = coefs
+        self.covs[idx] = covs
+        self.spread[idx] = spread
+        self.spread_mean[idx] = spread_mean
+        self.spread_var[idx] = spread_var
+        self.z_score[idx] = z_score
+        self.n_obs[idx] = n_obs
+
+        return self
+
+
+    def _get_pair_symbols(self):
+        symbols1 = [pair[0] for pair in self.pairs]
+        symbols2 = [pair[1] for pair in self.pairs]
+
+        return symbols1, symbols2
+
+
+    def _get_pairs_array(self):
+        # Symbols keep their own dtype, so they are loaded back unchanged
+        if not self.pairs:
+            return np.zeros((0, 2), dtype=str)
+
+        symbol_types = {type(symbol) for pair in self.pairs for symbol in pair}
+        pairs = np.array(self.pairs)
+        if len(symbol_types) > 1 or pairs.ndim != 2 or pairs.dtype.kind not in 'biuU':
+            msg1 = 'Only pairs of string or integer symbols of one type can be checkpointed.'
+            msg2 = f'Symbol types: {", ".join(sorted(item.__name__ for item in symbol_types))}.'
+            raise ValueError(' '.join([msg1, msg2]))
+
+        return pairs
+
+
+    @staticmethod
+    def _validate_params(forgetting, span):
+        if not 0 < forgetting <= 1:
+            raise ValueError('Argument forgetting must be in (0, 1]')
+
+        if span < 1:
+            raise ValueError('Argument span must be at least 1')
+
+        return
+
@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 
+from quantfin.portfolio._selection import top_k_mask
+
 
 class Watchlist():
 
@@ -176,8 +178,8 @@ class Watchlist():
         if curr_low_risk_positions > low_risk_slots:
             excess_slots = curr_low_risk_positions - low_risk_slots
             curr_low_risk = (obs[proba_lr_column] * (~is_new & is_nominated & is_low_risk & (holding_days >= 3)))
-            curr_low_risk_ranking = curr_low_risk.replace(0, np.nan).rank()
-            obs.loc[curr_low_risk_ranking <= excess_slots, [self.nomination_field, self.new_action]] = [self.nomination_lvl3, self.action_sell]
+            curr_low_risk_lowest = top_k_mask(-curr_low_risk.replace(0, np.nan).to_numpy(dtype=np.float64), excess_slots)
+            obs.loc[curr_low_risk_lowest, [self.nomination_field, self.new_action]] = [self.nomination_lvl3, self.action_sell]
             avail_low_risk_postions = 0
         else: 
             avail_low_risk_postions = low_risk_slots - curr_low_risk_positions
@@ -185,19 +187,19 @@ class Watchlist():
         if curr_high_risk_positions > high_risk_slots:
             excess_slots = curr_high_risk_positions - high_risk_slots
             curr_high_risk = (obs[proba_hr_column] * (~is_new & is_nominated & is_high_risk & (holding_days >= 3)))
-            curr_high_risk_ranking = curr_high_risk.replace(0, np.nan).rank()
-            obs.loc[curr_high_risk_ranking <= excess_slots, [self.nomination_field, self.new_action]] = [self.nomination_lvl3, self.action_sell]
+            curr_high_risk_lowest = top_k_mask(-curr_high_risk.replace(0, np.nan).to_numpy(dtype=np.float64), excess_slots)
+            obs.loc[curr_high_risk_lowest, [self.nomination_field, self.new_action]] = [self.nomination_lvl3, self.action_sell]
             avail_high_risk_postions = 0
         else:
             avail_high_risk_postions = high_risk_slots - curr_high_risk_positions
         
-        # Rank prediction proba
-        low_risk_ranking = (obs[proba_lr_column] * (is_new & is_nominated & is_low_risk)).rank(ascending=False)
-        high_risk_ranking = (obs[proba_hr_column] * (is_new & is_nominated & is_high_risk)).rank(ascending=False)
+        # Select top prediction proba
+        low_risk_proba = obs[proba_lr_column] * (is_new & is_nominated & is_low_risk)
+        high_risk_proba = obs[proba_hr_column] * (is_new & is_nominated & is_high_risk)
         
         # Select stocks
-        selected_low_risk = obs[low_risk_ranking <= avail_low_risk_postions]
-        selected_high_risk = obs[high_risk_ranking <= avail_high_risk_postions]
+        selected_low_risk = obs[top_k_mask(low_risk_proba.to_numpy(dtype=np.float64), avail_low_risk_postions)]
+        selected_high_risk = obs[top_k_mask(high_risk_proba.to_numpy(dtype=np.float64), avail_high_risk_postions)]
         
         # Return selected observations
         return pd.concat([selected_low_risk, selected_high_risk, obs[~is_new]])
@@ -5,11 +5,18 @@ import copy
 from itertools import combinations, combinations_with_replacement
 from sklearn.base import BaseEstimator, TransformerMixin
 
+from quantfin.preprocessing.panel import PanelStore, as_frame
+
 
 def train_backtest_split(data, level=0, from_year=None):
     if not from_year:
         raise ValueError('Parameter from_year must be specified')
     
+    if isinstance(data, PanelStore):
+        # Date-range views of the same memory-mapped panel
+        split_idx = int(np.searchsorted(data.get_dates().year, from_year))
+        return data.select_dates(end_idx=split_idx), data.select_dates(start_idx=split_idx)
+    
     train_set = data.loc[data.index.get_level_values(level).year < from_year]
     backtest_set = data.loc[data.index.get_level_values(level).year >= from_year]
     
@@ -17,6 +24,7 @@ def train_backtest_split(data, level=0, from_year=None):
 
 
 def calculate_target_sharpe(data, groupby, input_field, forward_look=5):
+    data = as_frame(data, [input_field])
     exp_sharpes = pd.DataFrame(columns=['exp_daily_ret', 'exp_ret', 'exp_ret_std', 'exp_sharpe'], index=data.index)
     exp_sharpes['exp_daily_ret'] = data.groupby(groupby)[input_field].pct_change().shift(-1)
     exp_sharpes['exp_ret'] = exp_sharpes.groupby(groupby)['exp_daily_ret'].rolling(forward_look).mean().shift(-forward_look + 1)
@@ -28,6 +36,7 @@ def calculate_target_sharpe(data, groupby, input_field, forward_look=5):
 
 
 def calculate_hist_sharpe(data, groupby, input_field, *windows):
+    data = as_frame(data, [input_field])
     if not windows:
         windows = [10]
     
@@ -48,6 +57,7 @@ def calculate_hist_sharpe(data, groupby, input_field, *windows):
 
 
 def calculate_hist_volume(data, groupby, input_field, *windows):
+    data = as_frame(data, [input_field])
     if not windows:
         windows = [10]
     
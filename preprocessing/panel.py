@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+# Import standard libraries
+import json
+from pathlib import Path
+
+# Import third-party libraries
+import pandas as pd
+import numpy as np
+
+# Import local module
+from quantfin.portfolio._files import atomic_write
+
+
+def factorize_panel_keys(data, symbol_col='symbol', date_col='date'):
+    """
+    Factorize the (symbol, date) index of a long frame into panel positions.
+
+    Returns the date and symbol codes of the rows with both keys present,
+    the sorted dates and symbols, and the mask of those rows in `data`.
+    Duplicated (date, symbol) keys raise a ValueError.
+    """
+    date_codes, dates = pd.factorize(data.index.get_level_values(date_col), sort=True)
+    symbol_codes, symbols = pd.factorize(data.index.get_level_values(symbol_col), sort=True)
+    is_valid = (date_codes >= 0) & (symbol_codes >= 0)
+    date_codes = date_codes[is_valid]
+    symbol_codes = symbol_codes[is_valid]
+
+    keys = date_codes.astype(np.int64) * len(symbols) + symbol_codes
+    if len(np.unique(keys)) < len(keys):
+        msg1 = f'Data has duplicated ({date_col}, {symbol_col}) keys.'
+        msg2 = 'Each symbol must have at most one row per date.'
+        raise ValueError(' '.join([msg1, msg2]))
+
+    return date_codes, dates, symbol_codes, symbols, is_valid
+
+
+class PanelStore():
+    """
+    On-disk date x symbol panel, one memory-mapped .npy file per field.
+
+    The directory holds a manifest (field names, index names), the date and
+    symbol dictionaries (sorted, row and column positions of every array)
+    and a mask of the (date, symbol) rows present in the source frame.
+    Fields are opened read-only with np.load(mmap_mode='r'), so processes
+    reading the same store share pages through the OS cache without copies.
+    Use PanelStore.from_frame() to write a store and PanelStore(path) to
+    open it again.
+    """
+
+    manifest_name = 'panel.json'
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / self.manifest_name) as manifest_file:
+            manifest = json.load(manifest_file)
+
+        self.fields = manifest['fields']
+        self.symbol_col = manifest['symbol_col']
+        self.date_col = manifest['date_col']
+        self.dates = pd.DatetimeIndex(np.load(self.path / 'dates.npy'), name=self.date_col)
+        self.symbols = pd.Index(np.load(self.path / 'symbols.npy'), name=self.symbol_col)
+        self.rows = np.load(self.path / 'rows.npy', mmap_mode='r')
+        self.date_range = slice(0, len(self.dates))
+        self._arrays = {}
+
+
+    @classmethod
+    def from_frame(cls, data, path, symbol_col='symbol', date_col='date', fields=None):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        fields = fields or [col for col in data.columns if pd.api.types.is_numeric_dtype(data[col])]
+
+        date_codes, dates, symbol_codes, symbols, is_valid = factorize_panel_keys(data, symbol_col, date_col)
+
+        np.save(path / 'dates.npy', np.asarray(dates, dtype='datetime64[ns]'))
+        # Symbols are stored as fixed-width strings, so loading never needs pickle
+        symbol_values = np.asarray(symbols)
+        np.save(path / 'symbols.npy', symbol_values.astype(str) if symbol_values.dtype == object else symbol_values)
+        rows = np.zeros((len(dates), len(symbols)), dtype=bool)
+        rows[date_codes, symbol_codes] = True
+        np.save(path / 'rows.npy', rows)
+
+        # Write every field straight into its memory-mapped file
+        for field_num, field in enumerate(fields):
+            values = np.lib.format.open_memmap(path / f'field_{field_num}.npy', mode='w+', dtype=np.float64, shape=rows.shape)
+            values[:] = np.nan
+            values[date_codes, symbol_codes] = data[field].to_numpy(dtype=np.float64)[is_valid]
+            values.flush()
+            del values
+
+        manifest = {'fields': list(fields), 'symbol_col': symbol_col, 'date_col': date_col}
+        with open(path / cls.manifest_name, 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+
+        return cls(path)
+
+
+    def __getitem__(self, field):
+        if field not in self.fields:
+            raise KeyError(field)
+
+        if field not in self._arrays:
+            self._arrays[field] = np.load(self.path / f'field_{self.fields.index(field)}.npy', mmap_mode='r')
+
+        return self._arrays[field][self.date_range]
+
+
+    def __contains__(self, field):
+        return field in self.fields
+
+
+    def __len__(self):
+        return len(self.get_dates())
+
+
+    @property
+    def columns(self):
+        return pd.Index(self.fields)
+
+
+    def get_dates(self):
+        return self.dates[self.date_range]
+
+
+    def get_rows(self):
+        return self.rows[self.date_range]
+
+
+    def select_dates(self, start_idx=None, end_idx=None):
+        # View of a date range, sharing the same memory-mapped files
+        panel = PanelStore.__new__(PanelStore)
+        panel.__dict__.update(self.__dict__)
+        panel.fields = list(self.fields)
+        panel._arrays = dict(self._arrays)
+        start_idx, end_idx, _ = slice(start_idx, end_idx).indices(len(self))
+        panel.date_range = slice(self.date_range.start + start_idx, self.date_range.start + end_idx)
+
+        return panel
+
+
+    def write(self, field, values):
+        # Add a computed date x symbol field to the store
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != self.rows.shape:
+            raise ValueError(f'Field {field} must have shape {self.rows.shape}')
+
+        if field not in self.fields:
+            self.fields.append(field)
+
+        # Replaced rather than written over, so open memory maps keep the old values
+        with atomic_write(self.path / f'field_{self.fields.index(field)}.npy') as field_file:
+            np.save(field_file, values)
+        self._arrays.pop(field, None)
+
+        manifest = {'fields': self.fields, 'symbol_col': self.symbol_col, 'date_col': self.date_col}
+        with atomic_write(self.path / self.manifest_name, 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+
+        return self
+
+
+    def to_frame(self, fields=None):
+        # Long (symbol, date) frame of the present rows, like the source frame
+        fields = fields or self.fields
+        date_idx, symbol_idx = np.nonzero(self.get_rows().T)[::-1]
+        index = pd.MultiIndex.from_arrays(
+            [self.symbols[symbol_idx], self.get_dates()[date_idx]],
+            names=[self.symbol_col, self.date_col]
+        )
+
+        return pd.DataFrame({field: self[field][date_idx, symbol_idx] for field in fields}, index=index)
+
+
+    def pct_change(self, field):
+        # Per-symbol pct_change over the present rows, prices padded forward
+        values = np.where(self.get_rows(), self[field], np.nan)
+        date_idx = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+        filled = np.take_along_axis(values, np.maximum.accumulate(date_idx, axis=0), axis=0)
+
+        changes = np.full(values.shape, np.nan)
+        changes[1:] = filled[1:] / filled[:-1] - 1
+        changes[~self.get_rows()] = np.nan
+
+        return changes
+
+
+def as_frame(data, fields=None):
+    # Featuring functions work on long frames, panels are loaded field by field
+    if isinstance(data, PanelStore):
+        return data.to_frame(fields)
+
+    return data
@@ -9,6 +9,9 @@ from sklearn.preprocessing import StandardScaler, MinMaxScaler, Normalizer, KBin
 # Stats library
 from statsmodels.tsa.stattools import adfuller
 
+# Local libraries
+from quantfin.portfolio._hurst import hurst_exponents
+
 # Other libraries
 import copy
 import warnings
@@ -505,7 +508,8 @@ class RollingStatsCalculator():
     
 
     def _get_hurst_val(self, series):
-        return np.apply_along_axis(self.__hurst_sub_func, 1, series)
+        # All windows at once, zero dispersions floored so their log stays finite
+        return hurst_exponents(series, int(series.shape[1]*self.hurst_max_range), min_tau=1e-10)
     
 
     def __adf_sub_func(self, sub_series):
@@ -515,27 +519,6 @@ class RollingStatsCalculator():
         else:
             return adf_val[1]
 
-    def __hurst_sub_func(self, sub_series):
-        lags = range(2, int(len(sub_series)*self.hurst_max_range))
-        # Calculate the array of the variances of the lagged differences
-        tau = [self.__tau_sub_func(sub_series, lag) for lag in lags]
-
-        # Use a linear fit to estimate the Hurst Exponent
-        poly = np.polyfit(np.log(lags), np.log(tau), 1)
-        
-        return poly[0] * 2
-    
-
-    def __tau_sub_func(self, sub_series, lag):
-        lags_var = np.sqrt(
-            np.std(np.subtract(sub_series[lag:], sub_series[:-lag]))
-        )
-        if lags_var == 0:
-            return 1e-10
-        else:
-            return lags_var
-    
-
     def _get_rolling_subsets(self, values, window):
         as_strided = np.lib.stride_tricks.as_strided
         v = as_strided(values, (len(values) - (window - 1), window), (values.strides * 2))
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+# Import standard libraries
+import multiprocessing
+from pathlib import Path
+
+# Import third-party libraries
+import pandas as pd
+import pytest
+
+# Import local module
+from quantfin.portfolio import _pool
+from quantfin.portfolio.backtest import Backtest
+from quantfin.portfolio.benchmark import make_synthetic_panel
+
+
+# Results of the original pandas engine, before any engine change, on the panel and grid below
+ORIGINAL_RESULTS_PATH = Path(__file__).parent / 'data' / 'original_backtest_results.csv'
+
+# 2 x 2 x 2 = 8 options
+STRATS = {
+    'buy_strats': [
+        {'type': 'simple_compare', 'col': 'vol_avg_100', 'operation': '>=', 'threshold': [10000, 50000]},
+        {'type': 'simple_compare', 'col': 'pred_val', 'operation': 'in', 'threshold': [[1, 2], [2]]},
+    ],
+    'sell_strats': [
+        {'type': 'simple_compare', 'col': 'pred_val', 'operation': '<', 'threshold': [0]},
+        {'type': 'holding_days', 'col': None, 'operation': '>=', 'threshold': [3, 10]},
+        {'type': 'trailing_stoploss', 'col': None, 'operation': '>=', 'threshold': [0.05]},
+    ],
+    'portfolio_size': [5],
+    'low_risk_prop': [0.4],
+}
+
+
+def _quiet(event):
+    return
+
+
+@pytest.fixture(scope='module')
+def panel():
+    return make_synthetic_panel(n_symbols=30, n_years=1, seed=1)
+
+
+@pytest.fixture(scope='module')
+def expected(panel):
+    return Backtest(panel.copy(), engine='pandas', **STRATS).run(progress=_quiet)
+
+
+def assert_results_equal(results, expected):
+    pd.testing.assert_frame_equal(
+        results.reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+        check_exact=True
+    )
+
+
+def test_pandas_engine_matches_original_results(expected):
+    original = pd.read_csv(ORIGINAL_RESULTS_PATH, index_col='option', float_precision='round_trip')
+
+    assert_results_equal(expected[original.columns], original)
+
+
+@pytest.mark.parametrize('batch_size', [1, 4])
+def test_numpy_engine_matches_pandas_engine(panel, expected, batch_size):
+    backtest = Backtest(panel.copy(), engine='numpy', batch_size=batch_size, **STRATS)
+
+    assert_results_equal(backtest.run(progress=_quiet), expected)
+
+
+@pytest.mark.parametrize('start_method', ['fork', 'spawn'])
+def test_pool_matches_sequential_run(panel, expected, start_method, monkeypatch):
+    if start_method not in multiprocessing.get_all_start_methods():
+        pytest.skip(f'{start_method} is not available on this platform')
+
+    monkeypatch.setattr(_pool.os, 'cpu_count', lambda: 2)
+    monkeypatch.setattr(_pool, '_get_context', lambda: multiprocessing.get_context(start_method))
+    backtest = Backtest(panel.copy(), engine='numpy', **STRATS)
+
+    assert_results_equal(backtest.run(n_jobs=2, progress=_quiet), expected)
+
+
+def test_merged_shards_match_single_run(panel, expected, tmp_path):
+    backtest = Backtest(panel.copy(), engine='numpy', **STRATS)
+    for shard_num in range(3):
+        backtest.run(results_path=tmp_path / f'shard{shard_num}.parquet', progress=_quiet, shard=(shard_num, 3))
+
+    assert_results_equal(backtest.merge_results(str(tmp_path / 'shard*.parquet')), expected)
+
+
+def test_merge_rejects_missing_shards(panel, tmp_path):
+    backtest = Backtest(panel.copy(), engine='numpy', **STRATS)
+    backtest.run(results_path=tmp_path / 'shard0.parquet', progress=_quiet, shard=(0, 3))
+
+    with pytest.raises(ValueError, match='missing from the result files'):
+        backtest.merge_results([tmp_path / 'shard0.parquet'])
+
+
+def test_merge_rejects_other_strategy_grid(panel, tmp_path):
+    backtest = Backtest(panel.copy(), engine='numpy', **STRATS)
+    backtest.run(results_path=tmp_path / 'results.parquet', progress=_quiet)
+
+    other_strats = dict(STRATS, low_risk_prop=[0.6])
+    other_backtest = Backtest(panel.copy(), engine='numpy', **other_strats)
+    with pytest.raises(ValueError, match='different strategy grid'):
+        other_backtest.merge_results([tmp_path / 'results.parquet'])
+    with pytest.raises(ValueError, match='different strategy grid'):
+        other_backtest.run(results_path=tmp_path / 'results.parquet', resume=True, progress=_quiet)
+
+
+def test_tie_breaking_depends_on_seed(panel):
+    # Prediction probabilities are rounded, so candidates often tie for the last slots
+    backtest = Backtest(panel.copy(), engine='numpy', **STRATS)
+    backtest.run(progress=_quiet)
+
+    results = [backtest.robustness(0, method='tie_breaking', n_sims=4, seed=seed, progress=_quiet) for seed in [0, 0, 1]]
+
+    pd.testing.assert_frame_equal(results[0], results[1])
+    assert results[0]['cumm_return'].nunique() > 1
+    assert not results[0].equals(results[2])
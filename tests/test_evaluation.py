@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+# Import third-party libraries
+import pandas as pd
+import numpy as np
+import pytest
+
+# Import local module
+from quantfin.portfolio.evaluation import johansen_test_batch
+
+
+@pytest.fixture
+def prices():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(50 + np.cumsum(rng.normal(size=(300, 3)), axis=0), columns=['a', 'b', 'c'])
+
+
+def test_johansen_test_batch_labels_match_positions(prices):
+    by_label = johansen_test_batch(prices, [['a', 'c']])
+    by_position = johansen_test_batch(prices.to_numpy(), [[0, 2]])
+
+    np.testing.assert_array_equal(by_label['half_lives'][0], by_position['half_lives'][0])
+
+
+@pytest.mark.parametrize('basket', [['a', 'zzz'], [0, 3], [0, -1]])
+def test_johansen_test_batch_rejects_missing_columns(prices, basket):
+    matrix = prices if isinstance(basket[-1], str) else prices.to_numpy()
+
+    with pytest.raises(ValueError, match='Missing columns'):
+        johansen_test_batch(matrix, [basket])
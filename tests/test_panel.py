@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+# Import third-party libraries
+import pandas as pd
+import pytest
+
+# Import local module
+from quantfin.portfolio.backtest import Backtest
+from quantfin.portfolio.benchmark import make_synthetic_panel
+from quantfin.preprocessing.panel import PanelStore
+
+
+@pytest.fixture(scope='module')
+def panel():
+    return make_synthetic_panel(n_symbols=10, n_years=1, seed=2)
+
+
+def test_from_frame_round_trip(panel, tmp_path):
+    store = PanelStore.from_frame(panel, tmp_path / 'panel')
+    frame = PanelStore(tmp_path / 'panel').to_frame()
+
+    pd.testing.assert_frame_equal(frame.sort_index(), panel.sort_index())
+    assert store.fields == list(panel.columns)
+
+
+def test_duplicated_keys_are_rejected(panel, tmp_path):
+    duplicated = pd.concat([panel, panel.iloc[:1]])
+
+    with pytest.raises(ValueError, match='duplicated'):
+        PanelStore.from_frame(duplicated, tmp_path / 'panel')
+    with pytest.raises(ValueError, match='duplicated'):
+        Backtest(duplicated.copy())
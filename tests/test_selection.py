@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+# Import third-party libraries
+import pandas as pd
+import numpy as np
+
+# Import local module
+from quantfin.portfolio._selection import top_k_mask
+
+
+def test_top_k_mask_matches_average_rank():
+    rng = np.random.default_rng(0)
+    values = np.round(rng.random((50, 20)), 1)
+    values[rng.random(values.shape) < 0.1] = np.nan
+
+    for k in [1, 2.5, 5, 20]:
+        expected = pd.DataFrame(values).rank(axis=1, ascending=False) <= k
+        np.testing.assert_array_equal(top_k_mask(values, k), expected.to_numpy())
+
+
+def test_top_k_mask_cuts_tie_group_by_tie_breaks():
+    values = np.array([0.9, 0.5, 0.5, 0.5, 0.1])
+
+    # The tie group's average rank is 3, so it is dropped without tie breaks
+    np.testing.assert_array_equal(top_k_mask(values, 2), [True, False, False, False, False])
+
+    tie_breaks = np.array([0.0, 0.7, 0.2, 0.4, 0.0])
+    np.testing.assert_array_equal(top_k_mask(values, 2, tie_breaks), [True, False, True, False, False])
+    np.testing.assert_array_equal(top_k_mask(values, 3, tie_breaks), [True, False, True, True, False])